@@ -35,6 +35,10 @@ BLIND_MODE_INPUT_CHAR_LEN_LIMIT = int(
 CONVERSATION_TURN_LIMIT = 50
 # Session expiration time
 SESSION_EXPIRATION_TIME = 3600
+# Streamed chatbot updates are batched for up to this many seconds
+STREAM_FLUSH_INTERVAL = 0.05
+# ... or until this many chunks arrive
+STREAM_BATCH_MAX_SIZE = 32
 # CPU Instruction Set Architecture
 CPU_ISA = os.getenv("CPU_ISA")
 
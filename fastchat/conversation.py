@@ -337,6 +337,29 @@ class Conversation:
 
         return images
 
+    def get_prompt_tail(self, n_chars: int) -> str:
+        """Get the last `n_chars` characters of the prompt.
+
+        Only the most recent messages covering `n_chars` are formatted, so the cost
+        does not grow with the length of the conversation.
+        """
+        start = len(self.messages)
+        num_chars = 0
+        while start > 0 and num_chars < n_chars:
+            start -= 1
+            message = self.messages[start][1]
+            if type(message) is tuple:
+                message = message[0]
+            num_chars += len(message) if message else 0
+        # keep the role alternation seen by get_prompt
+        start -= start % 2
+        # CHATGLM numbers the rounds from the first message, and CLLM formats only the last
+        # two messages, whose separators depend on how many messages there are
+        if start == 0 or self.sep_style in (SeparatorStyle.CHATGLM, SeparatorStyle.CLLM):
+            return self.get_prompt()[-n_chars:]
+        tail_conv = dataclasses.replace(self, messages=self.messages[start:], offset=0)
+        return tail_conv.get_prompt()[-n_chars:]
+
     def set_system_message(self, system_message: str):
         """Set the system message."""
         self.system_message = system_message
@@ -2,14 +2,26 @@
 Chat State and Logging
 '''
 
+import atexit
+from collections import OrderedDict
+import io
 import json
+import logging
 import os
+import queue
+import random
+import threading
+import time
 from typing import Any, Literal, Optional
 from fastchat.conversation import Conversation
 
 
 import datetime
-import uuid
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 
 LOG_DIR = os.getenv("LOGDIR", "./logs")
@@ -17,6 +29,31 @@ LOG_DIR = os.getenv("LOGDIR", "./logs")
 The default output dir of log files
 '''
 
+LOG_WRITER_BATCH_SIZE = 256
+'''
+Max number of log lines written by the background writer in one batch
+'''
+LOG_WRITER_FLUSH_INTERVAL = 0.1
+'''
+Max seconds the background writer waits to fill a batch
+'''
+LOG_WRITER_MAX_QUEUE_SIZE = 10000
+'''
+Max number of pending log lines; beyond this, lines are appended synchronously
+'''
+LOG_WRITER_PUT_TIMEOUT = 0.05
+'''
+Max seconds to wait for room in a full log queue before appending the line synchronously
+'''
+LOG_WRITER_MAX_OPEN_FILES = 64
+'''
+Max number of log files the background writer keeps open between batches
+'''
+LOG_WRITER_BUFFER_SIZE = 1 << 16
+'''
+Userspace buffer size of each open log file
+'''
+
 
 class ModelChatState:
     '''
@@ -85,12 +122,20 @@ class ModelChatState:
     Current response type. Used for logging.
     '''
 
+    @staticmethod
+    def create_id() -> str:
+        '''
+        Create a new 32 hex chars id, same format as `uuid.uuid4().hex`.
+        Ids only label logs and sandboxes, so the module PRNG (reseeded on fork) is enough.
+        '''
+        return f"{random.getrandbits(128):032x}"
+
     @staticmethod
     def create_chat_session_id() -> str:
         '''
         Create a new chat session id.
         '''
-        return uuid.uuid4().hex
+        return ModelChatState.create_id()
 
     @staticmethod
     def create_battle_chat_states(
@@ -121,7 +166,7 @@ class ModelChatState:
         from fastchat.model.model_adapter import get_conversation_template
 
         self.conv = get_conversation_template(model_name)
-        self.conv_id = uuid.uuid4().hex
+        self.conv_id = ModelChatState.create_id()
         # if no chat session id is provided, use the conversation id
         self.chat_session_id = chat_session_id if chat_session_id else self.conv_id
         self.chat_start_time = datetime.datetime.now()
@@ -135,6 +180,12 @@ class ModelChatState:
         # NOTE(chris): This could be sort of a hack since it assumes the user only uploads one image. If they can upload multiple, we should store a list of image hashes.
         self.has_csam_image = False
 
+        # chatbot list reused while streaming, see `to_gradio_chatbot_incremental`
+        self._chatbot_cache = None
+        self._chatbot_cache_len = 0
+        # log filepath per path prefix, see `get_conv_log_filepath`
+        self._conv_log_filepaths = {}
+
         self.regen_support = True
         if "browsing" in model_name:
             self.regen_support = False
@@ -142,15 +193,18 @@ class ModelChatState:
 
     def init_system_prompt(self, conv, is_vision):
         system_prompt = conv.get_system_message(is_vision)
-        if len(system_prompt) == 0:
+        # most templates carry no date placeholder
+        if "{{currentDateTime" not in system_prompt:
+            conv.set_system_message(system_prompt)
             return
-        current_date = datetime.datetime.now().strftime("%Y-%m-%d")
+        now = datetime.datetime.now()
+        current_date = now.strftime("%Y-%m-%d")
         system_prompt = system_prompt.replace("{{currentDateTime}}", current_date)
 
-        current_date_v2 = datetime.datetime.now().strftime("%d %b %Y")
+        current_date_v2 = now.strftime("%d %b %Y")
         system_prompt = system_prompt.replace("{{currentDateTimev2}}", current_date_v2)
 
-        current_date_v3 = datetime.datetime.now().strftime("%B %Y")
+        current_date_v3 = now.strftime("%B %Y")
         system_prompt = system_prompt.replace("{{currentDateTimev3}}", current_date_v3)
         conv.set_system_message(system_prompt)
 
@@ -169,6 +223,26 @@ class ModelChatState:
         '''
         return self.conv.to_gradio_chatbot()
 
+    def to_gradio_chatbot_incremental(self):
+        '''
+        Convert to a Gradio chatbot, reusing the previous result when only the last reply changed.
+        Meant for streaming, where the last message is updated once per chunk.
+        '''
+        conv = self.conv
+        num_messages = len(conv.messages)
+        # the cached list is valid while no message was added or removed and the last one is a reply
+        if (
+            self._chatbot_cache is None
+            or self._chatbot_cache_len != num_messages
+            or (num_messages - conv.offset) % 2 != 0
+            or not self._chatbot_cache
+        ):
+            self._chatbot_cache = conv.to_gradio_chatbot()
+            self._chatbot_cache_len = num_messages
+        else:
+            self._chatbot_cache[-1][1] = conv.messages[-1][1]
+        return self._chatbot_cache
+
     def get_conv_log_filepath(self, path_prefix: str):
         '''
         Get the filepath for the conversation log.
@@ -179,14 +253,18 @@ class ModelChatState:
                 ├── conv_logs/
                 └── sandbox_logs/
         '''
-        date_str = self.chat_start_time.strftime('%Y_%m_%d')
-        filepath = os.path.join(
-            path_prefix,
-            date_str,
-            'conv_logs',
-            self.chat_mode,
-            f"conv-log-{self.chat_session_id}.json"
-        )
+        # everything in the path is fixed for the chat, so it's only built once
+        filepath = self._conv_log_filepaths.get(path_prefix)
+        if filepath is None:
+            date_str = self.chat_start_time.strftime('%Y_%m_%d')
+            filepath = os.path.join(
+                path_prefix,
+                date_str,
+                'conv_logs',
+                self.chat_mode,
+                f"conv-log-{self.chat_session_id}.json"
+            )
+            self._conv_log_filepaths[path_prefix] = filepath
         return filepath
 
     def to_dict(self):
@@ -245,15 +323,187 @@ class ModelChatState:
         return data
 
 
+class LocalLogWriter:
+    '''
+    Appends log lines to local files from a background thread.
+    Lines queued within one flush interval are grouped by file and written at once,
+    so request handlers never block on file I/O.
+    Recently used files stay open between batches and are flushed at the end of each batch.
+    When the queue stays full, lines are appended by the caller instead of being dropped.
+    '''
+
+    def __init__(
+        self,
+        batch_size: int = LOG_WRITER_BATCH_SIZE,
+        flush_interval: float = LOG_WRITER_FLUSH_INTERVAL,
+        max_queue_size: int = LOG_WRITER_MAX_QUEUE_SIZE,
+        max_open_files: int = LOG_WRITER_MAX_OPEN_FILES,
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_open_files = max_open_files
+
+        # only touched by the writer thread, most recently used last
+        self.open_files: OrderedDict[str, io.BufferedWriter] = OrderedDict()
+
+        self.logs = queue.Queue(maxsize=max_queue_size)
+        # number of lines appended synchronously because the queue was full
+        self.overflow_count = 0
+        self.thread = threading.Thread(target=self._write_logs, daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def log(self, log_path: str, line: bytes):
+        '''
+        Queue a line to be appended to the log file.
+        '''
+        try:
+            self.logs.put((log_path, line), timeout=LOG_WRITER_PUT_TIMEOUT)
+            return
+        except queue.Full:
+            pass
+        # the writer is falling behind, block on the append rather than lose the line
+        self.overflow_count += 1
+        if self.overflow_count % LOG_WRITER_MAX_QUEUE_SIZE == 1:
+            logging.warning(
+                f"Log queue is full, appended {self.overflow_count} lines synchronously so far"
+            )
+        try:
+            append_log_line(log_path, line)
+        except Exception:
+            logging.exception(f"Failed to write logs to {log_path}")
+
+    def close(self, timeout: float = 5.0):
+        '''
+        Flush the pending lines and stop the writer thread.
+        '''
+        if not self.thread.is_alive():
+            return
+        self.logs.put(None)
+        self.thread.join(timeout)
+
+    def _write_logs(self):
+        while True:
+            item = self.logs.get()
+            batch = [] if item is None else [item]
+            stopped = item is None
+            deadline = time.monotonic() + self.flush_interval
+            while not stopped and len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self.logs.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopped = True
+                else:
+                    batch.append(item)
+
+            lines_by_path: dict[str, list[bytes]] = {}
+            for log_path, line in batch:
+                lines_by_path.setdefault(log_path, []).append(line)
+            for log_path, lines in lines_by_path.items():
+                try:
+                    fout = self._get_open_file(log_path)
+                    fout.write(b"".join(lines))
+                    fout.flush()
+                except Exception:
+                    logging.exception(f"Failed to write logs to {log_path}")
+                    self._close_file(log_path)
+
+            if stopped:
+                for log_path in list(self.open_files):
+                    self._close_file(log_path)
+                return
+
+    def _get_open_file(self, log_path: str) -> io.BufferedWriter:
+        fout = self.open_files.get(log_path)
+        if fout is not None:
+            self.open_files.move_to_end(log_path)
+            return fout
+
+        while len(self.open_files) >= self.max_open_files:
+            self._close_file(next(iter(self.open_files)))
+        os.makedirs(os.path.dirname(log_path), exist_ok=True)
+        fd = os.open(log_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        fout = os.fdopen(fd, "ab", buffering=LOG_WRITER_BUFFER_SIZE)
+        self.open_files[log_path] = fout
+        return fout
+
+    def _close_file(self, log_path: str):
+        fout = self.open_files.pop(log_path, None)
+        if fout is None:
+            return
+        try:
+            fout.close()
+        except Exception:
+            logging.exception(f"Failed to close log file {log_path}")
+
+
+def append_log_line(log_path: str, line: bytes):
+    '''
+    Append a line to a log file with a single write, so it does not interleave with the writer thread.
+    '''
+    os.makedirs(os.path.dirname(log_path), exist_ok=True)
+    fd = os.open(log_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line)
+    finally:
+        os.close(fd)
+
+
+_local_log_writer = None
+_local_log_writer_lock = threading.Lock()
+
+
+def get_local_log_writer() -> LocalLogWriter:
+    global _local_log_writer
+    if _local_log_writer is None:
+        with _local_log_writer_lock:
+            if _local_log_writer is None:
+                _local_log_writer = LocalLogWriter()
+    return _local_log_writer
+
+
+def dump_log_line(log_data: dict[str, Any]) -> bytes:
+    '''
+    Serialize a log record to one NDJSON line.
+    Uses orjson when available, which writes datetimes and non-str keys as
+    `json.dumps(log_data, default=str)` does, but otherwise differs from it:
+    non-ASCII text is written as UTF-8 rather than escaped, there are no spaces after separators,
+    NaN and infinities are written as null, and dataclasses and enums are written as their
+    fields and values rather than their `str`.
+    The lines parse to the same records with `json.loads`, apart from those last two cases.
+    '''
+    if orjson is not None:
+        try:
+            return orjson.dumps(
+                log_data,
+                default=str,
+                option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE,
+            )
+        except TypeError:
+            # e.g. integers beyond 64 bits, fall back to the stdlib encoder
+            pass
+    return (json.dumps(log_data, default=str) + "\n").encode()
+
+
 def save_log_to_local(
     log_data: dict[str, Any],
     log_path: str,
     write_mode: Literal['overwrite', 'append'] = 'append'
 ):
     '''
-    Save the log locally.
+    Save the log locally as NDJSON.
+    Appends are handed to the background writer; overwrites are written immediately.
     '''
-    log_json = json.dumps(log_data, default=str)
+    # serialize now, the state may change before the writer runs
+    log_line = dump_log_line(log_data)
+    if write_mode == 'append':
+        get_local_log_writer().log(log_path, log_line)
+        return
     os.makedirs(os.path.dirname(log_path), exist_ok=True)
-    with open(log_path, "w" if write_mode == 'overwrite' else 'a') as fout:
-        fout.write(log_json + "\n")
+    with open(log_path, "wb") as fout:
+        fout.write(log_line)
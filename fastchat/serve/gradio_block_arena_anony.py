@@ -35,13 +35,18 @@ from fastchat.serve.gradio_web_server import (
     get_model_description_md,
     set_chat_system_messages
 )
+from fastchat.serve import model_sampling
 from fastchat.serve.model_sampling import (
     ANON_MODELS,
     BATTLE_STRICT_TARGETS,
     BATTLE_TARGETS,
-    OUTAGE_MODELS,
+    SAMPLING_BOOST_FACTOR,
     SAMPLING_BOOST_MODELS,
-    SAMPLING_WEIGHTS
+    SAMPLING_WEIGHTS,
+    build_alias_table,
+    build_cum_weights,
+    sample_alias,
+    sample_cum_weights,
 )
 from fastchat.serve.remote_logger import get_remote_logger
 
@@ -54,6 +59,7 @@ from fastchat.serve.sandbox.code_runner import (SUPPORTED_SANDBOX_ENVIRONMENTS,
 from fastchat.serve.sandbox.sandbox_telemetry import log_sandbox_telemetry_gradio_fn, save_conv_log_to_azure_storage
 from fastchat.utils import (
     build_logger,
+    load_html2canvas_js,
     moderation_filter,
 )
 from fastchat.serve.sandbox.code_analyzer import SandboxEnvironment
@@ -256,12 +262,12 @@ def share_click(state0, state1, model_selector0, model_selector1, request: gr.Re
         )
 
 
-def get_sample_weight(model, outage_models, sampling_weights, sampling_boost_models=[]):
+def get_sample_weight(model, outage_models, sampling_weights, sampling_boost_models=frozenset()):
     if model in outage_models:
         return 0
     weight = sampling_weights.get(model, 0)
     if model in sampling_boost_models:
-        weight *= 5
+        weight *= SAMPLING_BOOST_FACTOR
     return weight
 
 
@@ -275,56 +281,73 @@ def is_model_match_pattern(model, patterns):
     return flag
 
 
+# sampling tables per model list and sampling config, see `get_battle_pair`
+battle_pair_cache = {}
+BATTLE_PAIR_CACHE_SIZE = 64
+
+
 def get_battle_pair(
     models, battle_targets, outage_models, sampling_weights, sampling_boost_models
 ):
     if len(models) == 1:
         return models[0], models[0]
 
-    model_weights = []
-    for model in models:
-        weight = get_sample_weight(
-            model, outage_models, sampling_weights, sampling_boost_models
+    # the outage and boost models are frozensets and keyed by value, so updating them
+    # picks fresh tables. The other configs are module constants, keyed by identity.
+    key = (
+        tuple(models),
+        id(battle_targets),
+        outage_models,
+        id(sampling_weights),
+        sampling_boost_models,
+    )
+    cached = battle_pair_cache.get(key)
+    if cached is None:
+        if len(battle_pair_cache) >= BATTLE_PAIR_CACHE_SIZE:
+            battle_pair_cache.clear()
+        model_weights = {
+            model: get_sample_weight(
+                model, outage_models, sampling_weights, sampling_boost_models
+            )
+            for model in models
+        }
+        # the rivals of each chosen model are filled in lazily
+        cached = battle_pair_cache[key] = (
+            build_alias_table(model_weights),
+            sum(model_weights.values()),
+            {},
         )
-        model_weights.append(weight)
-    total_weight = np.sum(model_weights)
-
-    model_weights = model_weights / total_weight
-    # print(models)
-    # print(model_weights)
-    chosen_idx = np.random.choice(len(models), p=model_weights)
-    chosen_model = models[chosen_idx]
-    # for p, w in zip(models, model_weights):
-    #     print(p, w)
-
-    rival_models = []
-    rival_weights = []
-    for model in models:
-        if model == chosen_model:
-            continue
-        if model in ANON_MODELS and chosen_model in ANON_MODELS:
-            continue
-        if chosen_model in BATTLE_STRICT_TARGETS:
-            if not is_model_match_pattern(model, BATTLE_STRICT_TARGETS[chosen_model]):
+    model_table, total_weight, rivals_cache = cached
+
+    chosen_model = sample_alias(model_table)
+
+    rivals = rivals_cache.get(chosen_model)
+    if rivals is None:
+        rival_weights = {}
+        for model in models:
+            if model == chosen_model:
                 continue
-        if model in BATTLE_STRICT_TARGETS:
-            if not is_model_match_pattern(chosen_model, BATTLE_STRICT_TARGETS[model]):
+            if model in ANON_MODELS and chosen_model in ANON_MODELS:
                 continue
-        weight = get_sample_weight(model, outage_models, sampling_weights)
-        if (
-            weight != 0
-            and chosen_model in battle_targets
-            and model in battle_targets[chosen_model]
-        ):
-            # boost to 20% chance
-            weight = 0.5 * total_weight / len(battle_targets[chosen_model])
-        rival_models.append(model)
-        rival_weights.append(weight)
-    # for p, w in zip(rival_models, rival_weights):
-    #     print(p, w)
-    rival_weights = rival_weights / np.sum(rival_weights)
-    rival_idx = np.random.choice(len(rival_models), p=rival_weights)
-    rival_model = rival_models[rival_idx]
+            if chosen_model in BATTLE_STRICT_TARGETS:
+                if not is_model_match_pattern(model, BATTLE_STRICT_TARGETS[chosen_model]):
+                    continue
+            if model in BATTLE_STRICT_TARGETS:
+                if not is_model_match_pattern(chosen_model, BATTLE_STRICT_TARGETS[model]):
+                    continue
+            weight = get_sample_weight(model, outage_models, sampling_weights)
+            if (
+                weight != 0
+                and chosen_model in battle_targets
+                and model in battle_targets[chosen_model]
+            ):
+                # boost to 20% chance
+                weight = 0.5 * total_weight / len(battle_targets[chosen_model])
+            rival_weights[model] = weight
+        # one table per chosen model, which is drawn from less often than the model table
+        rivals = rivals_cache[chosen_model] = build_cum_weights(rival_weights)
+
+    rival_model = sample_cum_weights(*rivals)
 
     swap = np.random.randint(2)
     if swap == 0:
@@ -360,7 +383,8 @@ def add_text_multi(
         model_left, model_right = get_battle_pair(
             models,
             BATTLE_TARGETS,
-            OUTAGE_MODELS,
+            # read at call time, `set_outage` replaces it
+            model_sampling.OUTAGE_MODELS,
             SAMPLING_WEIGHTS,
             SAMPLING_BOOST_MODELS,
         )
@@ -450,7 +474,7 @@ def add_text_single(
         model_left, model_right = get_battle_pair(
             models,
             BATTLE_TARGETS,
-            OUTAGE_MODELS,
+            model_sampling.OUTAGE_MODELS,
             SAMPLING_WEIGHTS,
             SAMPLING_BOOST_MODELS,
         )
@@ -485,7 +509,7 @@ def add_text_single(
          sandbox_state['enabled_round'] += 1 
     return (state, state.to_gradio_chatbot(), "") + (disable_btn,) * sandbox_state["btn_list_length"]
 
-def bot_response_multi(
+async def bot_response_multi(
     state0,
     state1,
     temperature,
@@ -560,10 +584,10 @@ def bot_response_multi(
             try:
                 # yield fewer times if chunk size is larger
                 if model_tpy[i] == 1 or (iters % model_tpy[i] == 1 or iters < 3):
-                    ret = next(gen[i])
+                    ret = await gen[i].__anext__()
                     states[i], chatbots[i] = ret[0], ret[1]
                 stop = False
-            except StopIteration:
+            except StopAsyncIteration:
                 pass
         yield states + chatbots + [disable_btn] * sandbox_state0['btn_list_length']
         if stop:
@@ -939,7 +963,9 @@ def build_side_by_side_ui_anony(models):
     share_js = """
 function (a, b, c, d) {
     const captureElement = document.querySelector('#share-region-anony');
-    html2canvas(captureElement)
+{{LOAD_HTML2CANVAS}}
+    window.html2canvasLoaded
+        .then(() => html2canvas(captureElement))
         .then(canvas => {
             canvas.style.display = 'none'
             document.body.appendChild(canvas)
@@ -955,7 +981,7 @@ function (a, b, c, d) {
         });
     return [a, b, c, d];
 }
-"""
+""".replace("{{LOAD_HTML2CANVAS}}", load_html2canvas_js)
     share_btn.click(share_click, states + model_selectors, [], js=share_js)
 
     textbox.submit(
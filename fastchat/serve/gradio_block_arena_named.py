@@ -36,6 +36,7 @@ from fastchat.serve.sandbox.code_runner import SandboxGradioSandboxComponents, S
 from fastchat.serve.sandbox.sandbox_telemetry import log_sandbox_telemetry_gradio_fn, save_conv_log_to_azure_storage
 from fastchat.utils import (
     build_logger,
+    load_html2canvas_js,
     moderation_filter,
 )
 from fastchat.serve.sandbox.code_analyzer import SandboxEnvironment
@@ -302,7 +303,7 @@ def add_text_multi(
     )
 
 
-def bot_response_multi(
+async def bot_response_multi(
     state0,
     state1,
     temperature,
@@ -379,10 +380,10 @@ def bot_response_multi(
             try:
                 # yield fewer times if chunk size is larger
                 if model_tpy[i] == 1 or (iters % model_tpy[i] == 1 or iters < 3):
-                    ret = next(gen[i])
+                    ret = await gen[i].__anext__()
                     states[i], chatbots[i] = ret[0], ret[1]
                 stop = False
-            except StopIteration:
+            except StopAsyncIteration:
                 pass
         yield states + chatbots + [disable_btn] * sandbox_state0['btn_list_length']
         if stop:
@@ -814,7 +815,9 @@ def build_side_by_side_ui_named(models):
     share_js = """
 function (a, b, c, d) {
     const captureElement = document.querySelector('#share-region-named');
-    html2canvas(captureElement)
+{{LOAD_HTML2CANVAS}}
+    window.html2canvasLoaded
+        .then(() => html2canvas(captureElement))
         .then(canvas => {
             canvas.style.display = 'none'
             document.body.appendChild(canvas)
@@ -830,7 +833,7 @@ function (a, b, c, d) {
         });
     return [a, b, c, d];
 }
-"""
+""".replace("{{LOAD_HTML2CANVAS}}", load_html2canvas_js)
     share_btn.click(share_click, states + model_selectors, [], js=share_js)
 
     # Register regenerate and clear button handlers
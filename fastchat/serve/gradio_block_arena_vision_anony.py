@@ -58,15 +58,14 @@ from fastchat.serve.gradio_block_arena_vision import (
     disable_multimodal,
 )
 from fastchat.serve.gradio_global_state import Context
+from fastchat.serve import model_sampling
 from fastchat.serve.model_sampling import (
     VISION_BATTLE_TARGETS,
-    VISION_OUTAGE_MODELS,
     VISION_SAMPLING_BOOST_MODELS,
     VISION_SAMPLING_WEIGHTS,
     SAMPLING_WEIGHTS,
     BATTLE_TARGETS,
     SAMPLING_BOOST_MODELS,
-    OUTAGE_MODELS,
 )
 from fastchat.serve.remote_logger import get_remote_logger
 from fastchat.serve.sandbox.sandbox_state import ChatbotSandboxState
@@ -75,6 +74,7 @@ from fastchat.serve.sandbox.code_runner import SUPPORTED_SANDBOX_ENVIRONMENTS, S
 from fastchat.serve.sandbox.sandbox_telemetry import log_sandbox_telemetry_gradio_fn
 from fastchat.utils import (
     build_logger,
+    load_html2canvas_js,
     moderation_filter,
     image_moderation_filter,
 )
@@ -463,13 +463,14 @@ def add_text_multi(
         model_left, model_right = get_battle_pair(
             context.all_vision_models,
             VISION_BATTLE_TARGETS,
-            VISION_OUTAGE_MODELS,
+            # read at call time, `set_outage` replaces them
+            model_sampling.VISION_OUTAGE_MODELS,
             VISION_SAMPLING_WEIGHTS,
             VISION_SAMPLING_BOOST_MODELS,
         ) if is_vision else get_battle_pair(
             context.all_text_models,
             BATTLE_TARGETS,
-            OUTAGE_MODELS,
+            model_sampling.OUTAGE_MODELS,
             SAMPLING_WEIGHTS,
             SAMPLING_BOOST_MODELS,
         )
@@ -1168,7 +1169,9 @@ For `npm` packages, you can use the format `npm (use '@' or 'latest') <package_n
     share_js = """
 function (a, b, c, d) {
     const captureElement = document.querySelector('#share-region-anony');
-    html2canvas(captureElement)
+{{LOAD_HTML2CANVAS}}
+    window.html2canvasLoaded
+        .then(() => html2canvas(captureElement))
         .then(canvas => {
             canvas.style.display = 'none'
             document.body.appendChild(canvas)
@@ -1184,7 +1187,7 @@ function (a, b, c, d) {
         });
     return [a, b, c, d];
 }
-"""
+""".replace("{{LOAD_HTML2CANVAS}}", load_html2canvas_js)
     share_btn.click(share_click, states + model_selectors, [], js=share_js)
 
     multimodal_textbox.input(
@@ -65,6 +65,7 @@ from fastchat.serve.sandbox.code_runner import DEFAULT_SANDBOX_INSTRUCTIONS, SUP
 from fastchat.serve.sandbox.sandbox_telemetry import log_sandbox_telemetry_gradio_fn, save_conv_log_to_azure_storage
 from fastchat.utils import (
     build_logger,
+    load_html2canvas_js,
     moderation_filter,
     image_moderation_filter,
 )
@@ -310,12 +311,143 @@ function() {
 }
 """
 
+share_js_vision_named = """
+function (a, b, c, d) {
+    const captureElement = document.querySelector('#share-region-named');
+{{LOAD_HTML2CANVAS}}
+    window.html2canvasLoaded
+        .then(() => html2canvas(captureElement))
+        .then(canvas => {
+            canvas.style.display = 'none'
+            document.body.appendChild(canvas)
+            return canvas
+        })
+        .then(canvas => {
+            const image = canvas.toDataURL('image/png')
+            const a = document.createElement('a')
+            a.setAttribute('download', 'chatbot-arena.png')
+            a.setAttribute('href', image)
+            a.click()
+            canvas.remove()
+        });
+    return [a, b, c, d];
+}
+""".replace("{{LOAD_HTML2CANVAS}}", load_html2canvas_js)
+
 logger = build_logger("gradio_web_server_multi", "gradio_web_server_multi.log")
 
 num_sides = 2
 enable_moderation = False
 USER_BUTTONS_LENGTH = 11
 
+# static layout content, shared by every session build
+notice_markdown = """
+## How It Works for Side-by-Side Chat Mode
+- **Choose Models**: Select two AI chatbots to chat with.
+- **Run & Interact**: The AI chatbots generate programs that run in a secure sandbox environment. Test the functionality, explore the features, and evaluate the quality of the outputs.
+- **Edit & Regenerate**: You can edit the <u>system prompt</u>, <u>code</u>, and its <u>dependency</u> and <u>regenerate the code</u> on any side.
+- **Visual Input**: Upload images or provide text prompts to guide the AI chatbots in their responses. You can only chat with <span style='color: #DE3163; font-weight: bold'>one image per conversation</span>. The image should be less than 15MB.
+- **Vote for the Best**: After interacting with both programs, vote for the one that best meets your requirements or provides the superior experience.
+
+## Note
+- **Sandbox**: There are four buttons on the top right corner of the sandbox inference. You can use them to copy the link, turn on/off the black mode, make the sandbox full screen, and reload the sandbox. Plus, you can also drag the bottom right corner of the sandbox to resize the sandbox.
+- **Dependency Edit**: You can edit the <u>dependency</u> of the code on any side. Currently, we only support `pypi` and `npm` packages.
+For `pypi` packages, you can use the format `python (use '==', '>=', '<=', '~=', '>', '<' or 'latest') <package_name> <version>`.
+For `npm` packages, you can use the format `npm (use '@' or 'latest') <package_name> <version>`.
+- **Temperature**: All models have the same temperature of `0.7` and `top_p` of `1.0` by default. You can adjust the hyperparameters in the `Parameters` section. Low temperature typically works better for code generation.
+
+**❗️ For research purposes, we log user prompts, images, and interactions with sandbox, and may release this data to the public in the future. Please do not upload any confidential or personal information.**
+"""
+
+sandbox_examples = [
+    ["使用SVG绘制春节主题的动态图案，包括：1）一个红色的灯笼，带有金色的流苏 2）一个金色的福字，使用书法字体 3）背景添加一些烟花效果 4）在灯笼和福字周围添加一些祥云图案。确保图案布局美观，颜色搭配符合春节传统风格。"],
+    ["SVGを使用して日本の伝統的な和柄パターンを描画してください。1）波紋（さざなみ）模様 2）市松模様 3）麻の葉模様 4）雷文（らいもん）模様を含めてください。色は伝統的な日本の色（藍色、朱色、金色など）を使用し、レイアウトはバランスよく配置してください。"],
+    ["Write HTML with P5.js that simulates 25 particles in a vacuum space of a cylindrical container, bouncing within its boundaries. Use different colors for each ball and ensure they leave a trail showing their movement. Add a slow rotation of the container to give better view of what's going on in the scene. Make sure to create proper collision detection and physic rules to ensure particles remain in the container. Add an external spherical container. Add a slow zoom in and zoom out effect to the whole scene."],
+    ["Write a Python script to scrape NVIDIA's stock price for the past month using the yfinance library. Clean the data and create an interactive visualization using Matplotlib. Include: 1) A candlestick chart showing daily price movements 2) A line chart with 7-day and 30-day moving averages. Add hover tooltips showing exact values and date. Make the layout professional with proper titles and axis labels."],
+    ["Write a Python script that uses the Gradio library to create a functional calculator. The calculator should support basic arithmetic operations: addition, subtraction, multiplication, and division. It should have two input fields for numbers and a dropdown menu to select the operation."],
+    ["Write a Todo list app using React.js. The app should allow users to add, delete, and mark tasks as completed. Include features like filtering tasks by status (completed, active), sorting tasks by priority, and displaying the total number of tasks."],
+    ["Write a Python script using the Streamlit library to create a web application for uploading and displaying files. The app should allow users to upload files of type .csv or .txt. If a .csv file is uploaded, display its contents as a table using Streamlit's st.dataframe() method. If a .txt file is uploaded, display its content as plain text."],
+    ["Write a Python function to solve the Trapping Rain Water problem. The function should take a list of non-negative integers representing the height of bars in a histogram and return the total amount of water trapped between the bars after raining. Use an efficient algorithm with a time complexity of O(n)."],
+    ["Create a simple Pygame script for a game where the player controls a bouncing ball that changes direction when it collides with the edges of the window. Add functionality for the player to control a paddle using arrow keys, aiming to keep the ball from touching the bottom of the screen. Include basic collision detection and a scoring system that increases as the ball bounces off the paddle. You need to add clickable buttons to start the game, and reset the game."],
+    ["Create a financial management Dashboard using Vue.js, focusing on local data handling without APIs. Include features like a clean dashboard for tracking income and expenses, dynamic charts for visualizing finances, and a budget planner. Implement functionalities for adding, editing, and deleting transactions, as well as filtering by date or category. Ensure responsive design and smooth user interaction for an intuitive experience."],
+    ["Create a Mermaid diagram to visualize a flowchart of a user login process. Include the following steps: User enters login credentials; Credentials are validated; If valid, the user is directed to the dashboard; If invalid, an error message is shown, and the user can retry or reset the password."],
+    ["Write a Python function to calculate the Fibonacci sequence up to n numbers. Then write test cases to verify the function works correctly for edge cases like negative numbers, zero, and large inputs."],
+    ["Build an HTML page for a Kanban board with three columns with Vue.js: To Do, In Progress, and Done. Each column should allow adding, moving, and deleting tasks. Implement drag-and-drop functionality using Vue Draggable and persist the state using Vuex."],
+    ["Develop a Streamlit app that takes a CSV file as input and provides: 1) Basic statistics about the data 2) Interactive visualizations using Plotly 3) A data cleaning interface with options to handle missing values 4) An option to download the cleaned data."],
+    ["Write an HTML page with embedded JavaScript that creates an interactive periodic table. Each element should display its properties on hover and allow filtering by category (metals, non-metals, etc.). Include a search bar to find elements by name or symbol."],
+    ["Here's a Python function that sorts a list of dictionaries by a specified key:\n\n```python\ndef sort_dicts(data, key):\n    return sorted(data, key=lambda x: x[key])\n```\n\nWrite test cases to verify the function works correctly for edge cases like empty lists, missing keys, and different data types. If you use unittest, please use `unittest.main(argv=['first-arg-is-ignored'], exit=False)` to run the tests."],
+    ["Create a React component for a fitness tracker that shows: 1) Daily step count 2) Calories burned 3) Distance walked 4) A progress bar for daily goals."],
+    ["Build a Vue.js dashboard for monitoring server health. Include: 1) Real-time CPU and memory usage graphs 2) Disk space visualization 3) Network activity monitor 4) Alerts for critical thresholds."],
+    ["Write a C program that calculates and prints the first 100 prime numbers in a formatted table with 10 numbers per row. Include a function to check if a number is prime and use it in your solution."],
+    ["Write a C++ program that implements a simple calculator using object-oriented programming. Create a Calculator class with methods for addition, subtraction, multiplication, and division. Include error handling for division by zero."],
+    ["Write a Rust program that generates and prints a Pascal's Triangle with 10 rows. Format the output to center-align the numbers in each row."],
+    ["Write a Java program that simulates a simple bank account system. Create a BankAccount class with methods for deposit, withdrawal, and balance inquiry. Include error handling for insufficient funds and demonstrate its usage with a few transactions."],
+    ["Write a Go program that calculates and prints the Fibonacci sequence up to the 50th number. Format the output in a table with 5 numbers per row and include the index of each Fibonacci number."],
+    ["Write a C program that calculates and prints a histogram of letter frequencies from a predefined string. Use ASCII art to display the histogram vertically."],
+    ["Write a C++ program that implements a simple stack data structure with push, pop, and peek operations. Demonstrate its usage by reversing a predefined string using the stack."],
+    ["Write a Rust program that calculates and prints the first 20 happy numbers. Include a function to check if a number is happy and use it in your solution."],
+    ["Write a Java program that implements a simple binary search algorithm. Create a sorted array of integers and demonstrate searching for different values, including cases where the value is found and not found."],
+    ["Write a Go program that generates and prints a multiplication table from 1 to 12. Format the output in a neat grid with proper alignment."],
+]
+
+sandbox_example_labels = [
+    "🏮 春节主题图案",
+    "🎎 日本の伝統的な和柄パターン",
+    "🌐 Particles in a Spherical Container",
+    "💹 NVIDIA Stock Analysis with Matplotlib",
+    "🧮 Calculator with Gradio",
+    "📝 Todo List App with React.js",
+    "📂 File Upload Web App with Streamlit",
+    "💦 Solve Trapping Rain Water Problem",
+    "🎮 Pygame Bouncing Ball Game",
+    "💳 Financial Dashboard with Vue.js",
+    "🔑 User Login Process Flowchart",
+    "🔢 Fibonacci Sequence with Tests",
+    "📌 Vue Kanban Board",
+    "🧹 Streamlit Data Cleaning App",
+    "⚗️ Interactive Periodic Table with React",
+    "📚 Dictionary Sorting Tests in Python",
+    "🏋️‍♂️ Fitness Tracker with React",
+    "🖥️ Vue Server Monitoring",
+    "🔢 Prime Numbers in C",
+    "🧮 OOP Calculator in C++",
+    "🔷 Pascal's Triangle in Rust",
+    "🏛️ Bank Account Simulation in Java",
+    "🐰 Fibonacci Sequence in Go",
+    "📊 Letter Frequency Histogram in C",
+    "📦 Stack Implementation in C++",
+    "😄 Happy Numbers in Rust",
+    "🔎 Binary Search in Java",
+    "✖️ Multiplication Table in Go",
+]
+
+# labels of the user buttons, shared by every session build
+button_labels = {
+    "send_left": "⬅️  Send to Left",
+    "send": "⬆️  Send",
+    "send_right": "➡️  Send to Right",
+    "regenerate_left": "🔄  Regenerate Left",
+    "regenerate": "🔄  Regenerate",
+    "regenerate_right": "🔄  Regenerate Right",
+    "leftvote": "👈  A is better",
+    "tie": "🤝  Tie",
+    "rightvote": "👉  B is better",
+    "bothbad": "👎  Both are bad",
+    "clear": "🎲 New Round",
+    "share": "📷  Share",
+}
+
+invisible_component = gr.update(visible=False)
+non_interactive_component = gr.update(interactive=False)
+
+
+def set_invisible_examples():
+    return invisible_component
+
+
+def set_invisible_examples_and_selectors():
+    return [invisible_component, non_interactive_component, non_interactive_component]
+
 
 def load_demo_side_by_side_vision_named(context: Context):
     states = [None] * num_sides
@@ -684,24 +816,6 @@ def add_text_multi(
 
 
 def build_side_by_side_vision_ui_named(context: Context, random_questions=None):
-    notice_markdown = f"""
-## How It Works for Side-by-Side Chat Mode
-- **Choose Models**: Select two AI chatbots to chat with.
-- **Run & Interact**: The AI chatbots generate programs that run in a secure sandbox environment. Test the functionality, explore the features, and evaluate the quality of the outputs.
-- **Edit & Regenerate**: You can edit the <u>system prompt</u>, <u>code</u>, and its <u>dependency</u> and <u>regenerate the code</u> on any side.
-- **Visual Input**: Upload images or provide text prompts to guide the AI chatbots in their responses. You can only chat with <span style='color: #DE3163; font-weight: bold'>one image per conversation</span>. The image should be less than 15MB.
-- **Vote for the Best**: After interacting with both programs, vote for the one that best meets your requirements or provides the superior experience.
-
-## Note
-- **Sandbox**: There are four buttons on the top right corner of the sandbox inference. You can use them to copy the link, turn on/off the black mode, make the sandbox full screen, and reload the sandbox. Plus, you can also drag the bottom right corner of the sandbox to resize the sandbox.
-- **Dependency Edit**: You can edit the <u>dependency</u> of the code on any side. Currently, we only support `pypi` and `npm` packages.
-For `pypi` packages, you can use the format `python (use '==', '>=', '<=', '~=', '>', '<' or 'latest') <package_name> <version>`.
-For `npm` packages, you can use the format `npm (use '@' or 'latest') <package_name> <version>`.
-- **Temperature**: All models have the same temperature of `0.7` and `top_p` of `1.0` by default. You can adjust the hyperparameters in the `Parameters` section. Low temperature typically works better for code generation.
-
-**❗️ For research purposes, we log user prompts, images, and interactions with sandbox, and may release this data to the public in the future. Please do not upload any confidential or personal information.**
-"""
-
     states = [gr.State() for _ in range(num_sides)]
     model_selectors: list[gr.Markdown | None] = [None] * num_sides
     chatbots: list[gr.Chatbot | None] = [None] * num_sides
@@ -787,66 +901,8 @@ For `npm` packages, you can use the format `npm (use '@' or 'latest') <package_n
 
     with gr.Row() as examples_row:
         example_prompts = gr.Examples(
-            examples = [
-                ["使用SVG绘制春节主题的动态图案，包括：1）一个红色的灯笼，带有金色的流苏 2）一个金色的福字，使用书法字体 3）背景添加一些烟花效果 4）在灯笼和福字周围添加一些祥云图案。确保图案布局美观，颜色搭配符合春节传统风格。"],
-                ["SVGを使用して日本の伝統的な和柄パターンを描画してください。1）波紋（さざなみ）模様 2）市松模様 3）麻の葉模様 4）雷文（らいもん）模様を含めてください。色は伝統的な日本の色（藍色、朱色、金色など）を使用し、レイアウトはバランスよく配置してください。"],
-                ["Write HTML with P5.js that simulates 25 particles in a vacuum space of a cylindrical container, bouncing within its boundaries. Use different colors for each ball and ensure they leave a trail showing their movement. Add a slow rotation of the container to give better view of what's going on in the scene. Make sure to create proper collision detection and physic rules to ensure particles remain in the container. Add an external spherical container. Add a slow zoom in and zoom out effect to the whole scene."],
-                ["Write a Python script to scrape NVIDIA's stock price for the past month using the yfinance library. Clean the data and create an interactive visualization using Matplotlib. Include: 1) A candlestick chart showing daily price movements 2) A line chart with 7-day and 30-day moving averages. Add hover tooltips showing exact values and date. Make the layout professional with proper titles and axis labels."],
-                ["Write a Python script that uses the Gradio library to create a functional calculator. The calculator should support basic arithmetic operations: addition, subtraction, multiplication, and division. It should have two input fields for numbers and a dropdown menu to select the operation."],
-                ["Write a Todo list app using React.js. The app should allow users to add, delete, and mark tasks as completed. Include features like filtering tasks by status (completed, active), sorting tasks by priority, and displaying the total number of tasks."],
-                ["Write a Python script using the Streamlit library to create a web application for uploading and displaying files. The app should allow users to upload files of type .csv or .txt. If a .csv file is uploaded, display its contents as a table using Streamlit's st.dataframe() method. If a .txt file is uploaded, display its content as plain text."],
-                ["Write a Python function to solve the Trapping Rain Water problem. The function should take a list of non-negative integers representing the height of bars in a histogram and return the total amount of water trapped between the bars after raining. Use an efficient algorithm with a time complexity of O(n)."],
-                ["Create a simple Pygame script for a game where the player controls a bouncing ball that changes direction when it collides with the edges of the window. Add functionality for the player to control a paddle using arrow keys, aiming to keep the ball from touching the bottom of the screen. Include basic collision detection and a scoring system that increases as the ball bounces off the paddle. You need to add clickable buttons to start the game, and reset the game."],
-                ["Create a financial management Dashboard using Vue.js, focusing on local data handling without APIs. Include features like a clean dashboard for tracking income and expenses, dynamic charts for visualizing finances, and a budget planner. Implement functionalities for adding, editing, and deleting transactions, as well as filtering by date or category. Ensure responsive design and smooth user interaction for an intuitive experience."],
-                ["Create a Mermaid diagram to visualize a flowchart of a user login process. Include the following steps: User enters login credentials; Credentials are validated; If valid, the user is directed to the dashboard; If invalid, an error message is shown, and the user can retry or reset the password."],
-                ["Write a Python function to calculate the Fibonacci sequence up to n numbers. Then write test cases to verify the function works correctly for edge cases like negative numbers, zero, and large inputs."],
-                ["Build an HTML page for a Kanban board with three columns with Vue.js: To Do, In Progress, and Done. Each column should allow adding, moving, and deleting tasks. Implement drag-and-drop functionality using Vue Draggable and persist the state using Vuex."],
-                ["Develop a Streamlit app that takes a CSV file as input and provides: 1) Basic statistics about the data 2) Interactive visualizations using Plotly 3) A data cleaning interface with options to handle missing values 4) An option to download the cleaned data."],
-                ["Write an HTML page with embedded JavaScript that creates an interactive periodic table. Each element should display its properties on hover and allow filtering by category (metals, non-metals, etc.). Include a search bar to find elements by name or symbol."],
-                ["Here's a Python function that sorts a list of dictionaries by a specified key:\n\n```python\ndef sort_dicts(data, key):\n    return sorted(data, key=lambda x: x[key])\n```\n\nWrite test cases to verify the function works correctly for edge cases like empty lists, missing keys, and different data types. If you use unittest, please use `unittest.main(argv=['first-arg-is-ignored'], exit=False)` to run the tests."],
-                ["Create a React component for a fitness tracker that shows: 1) Daily step count 2) Calories burned 3) Distance walked 4) A progress bar for daily goals."],
-                ["Build a Vue.js dashboard for monitoring server health. Include: 1) Real-time CPU and memory usage graphs 2) Disk space visualization 3) Network activity monitor 4) Alerts for critical thresholds."],
-                ["Write a C program that calculates and prints the first 100 prime numbers in a formatted table with 10 numbers per row. Include a function to check if a number is prime and use it in your solution."],
-                ["Write a C++ program that implements a simple calculator using object-oriented programming. Create a Calculator class with methods for addition, subtraction, multiplication, and division. Include error handling for division by zero."],
-                ["Write a Rust program that generates and prints a Pascal's Triangle with 10 rows. Format the output to center-align the numbers in each row."],
-                ["Write a Java program that simulates a simple bank account system. Create a BankAccount class with methods for deposit, withdrawal, and balance inquiry. Include error handling for insufficient funds and demonstrate its usage with a few transactions."],
-                ["Write a Go program that calculates and prints the Fibonacci sequence up to the 50th number. Format the output in a table with 5 numbers per row and include the index of each Fibonacci number."],
-                ["Write a C program that calculates and prints a histogram of letter frequencies from a predefined string. Use ASCII art to display the histogram vertically."],
-                ["Write a C++ program that implements a simple stack data structure with push, pop, and peek operations. Demonstrate its usage by reversing a predefined string using the stack."],
-                ["Write a Rust program that calculates and prints the first 20 happy numbers. Include a function to check if a number is happy and use it in your solution."],
-                ["Write a Java program that implements a simple binary search algorithm. Create a sorted array of integers and demonstrate searching for different values, including cases where the value is found and not found."],
-                ["Write a Go program that generates and prints a multiplication table from 1 to 12. Format the output in a neat grid with proper alignment."],
-            ],
-            example_labels=[
-                "🏮 春节主题图案",
-                "🎎 日本の伝統的な和柄パターン",
-                "🌐 Particles in a Spherical Container",
-                "💹 NVIDIA Stock Analysis with Matplotlib",
-                "🧮 Calculator with Gradio",
-                "📝 Todo List App with React.js",
-                "📂 File Upload Web App with Streamlit",
-                "💦 Solve Trapping Rain Water Problem",
-                "🎮 Pygame Bouncing Ball Game",
-                "💳 Financial Dashboard with Vue.js",
-                "🔑 User Login Process Flowchart",
-                "🔢 Fibonacci Sequence with Tests",
-                "📌 Vue Kanban Board",
-                "🧹 Streamlit Data Cleaning App",
-                "⚗️ Interactive Periodic Table with React",
-                "📚 Dictionary Sorting Tests in Python",
-                "🏋️‍♂️ Fitness Tracker with React",
-                "🖥️ Vue Server Monitoring",
-                "🔢 Prime Numbers in C",
-                "🧮 OOP Calculator in C++",
-                "🔷 Pascal's Triangle in Rust",
-                "🏛️ Bank Account Simulation in Java",
-                "🐰 Fibonacci Sequence in Go",
-                "📊 Letter Frequency Histogram in C",
-                "📦 Stack Implementation in C++",
-                "😄 Happy Numbers in Rust",
-                "🔎 Binary Search in Java",
-                "✖️ Multiplication Table in Go",
-            ],
+            examples=sandbox_examples,
+            example_labels=sandbox_example_labels,
             examples_per_page=100,
             label="Example Prompts",
             inputs = [multimodal_textbox],
@@ -992,44 +1048,44 @@ For `npm` packages, you can use the format `npm (use '@' or 'latest') <package_n
 
     with gr.Row():
         send_btn_left = gr.Button(
-            value="⬅️  Send to Left",
+            value=button_labels["send_left"],
             variant="primary",
             visible=False,
         )
         send_btn = gr.Button(
-            value="⬆️  Send",
+            value=button_labels["send"],
             variant="primary",
         )
         send_btn_right = gr.Button(
-            value="➡️  Send to Right",
+            value=button_labels["send_right"],
             variant="primary",
             visible=False,
         )
         send_btns_one_side = [send_btn_left, send_btn_right]
 
     with gr.Row():
-        left_regenerate_btn = gr.Button(value="🔄  Regenerate Left", interactive=False, visible=False)
-        regenerate_btn = gr.Button(value="🔄  Regenerate", interactive=False, visible=False)
-        right_regenerate_btn = gr.Button(value="🔄  Regenerate Right", interactive=False, visible=False)
+        left_regenerate_btn = gr.Button(value=button_labels["regenerate_left"], interactive=False, visible=False)
+        regenerate_btn = gr.Button(value=button_labels["regenerate"], interactive=False, visible=False)
+        right_regenerate_btn = gr.Button(value=button_labels["regenerate_right"], interactive=False, visible=False)
         regenerate_one_side_btns = [left_regenerate_btn, right_regenerate_btn]
 
     with gr.Row():
         leftvote_btn = gr.Button(
-            value="👈  A is better", visible=False, interactive=False
+            value=button_labels["leftvote"], visible=False, interactive=False
         )
         tie_btn = gr.Button(
-            value="🤝  Tie", visible=False, interactive=False
+            value=button_labels["tie"], visible=False, interactive=False
         )
         rightvote_btn = gr.Button(
-            value="👉  B is better", visible=False, interactive=False
+            value=button_labels["rightvote"], visible=False, interactive=False
         )
         bothbad_btn = gr.Button(
-            value="👎  Both are bad", visible=False, interactive=False
+            value=button_labels["bothbad"], visible=False, interactive=False
         )
     
     with gr.Row():
-        clear_btn = gr.Button(value="🎲 New Round", interactive=False)
-        share_btn = gr.Button(value="📷  Share")
+        clear_btn = gr.Button(value=button_labels["clear"], interactive=False)
+        share_btn = gr.Button(value=button_labels["share"])
 
     with gr.Accordion("Parameters", open=False) as parameter_row:
         temperature = gr.Slider(
@@ -1078,6 +1134,13 @@ For `npm` packages, you can use the format `npm (use '@' or 'latest') <package_n
         clear_btn,
     ] # 11 buttons, USER_BUTTONS_LENGTH
 
+    # shared by every chain that ends with bot_response_multi
+    bot_response_multi_inputs = states + [temperature, top_p, max_output_tokens] + sandbox_states
+    bot_response_multi_outputs = states + chatbots + user_buttons
+    # shared by the three triggers of add_text_multi
+    add_text_multi_inputs = states + model_selectors + sandbox_states + [multimodal_textbox, textbox] + [context_state]
+    add_text_multi_outputs = states + chatbots + sandbox_states + [multimodal_textbox, textbox] + user_buttons
+
     # Create a feedback state that persists across the chain
     feedback_state = gr.State("")
     # The hidden vote button used to trigger the vote submission
@@ -1100,31 +1163,19 @@ For `npm` packages, you can use the format `npm (use '@' or 'latest') <package_n
         outputs=[textbox] + user_buttons,
     )
 
-    leftvote_btn.click(
-        lambda: ("vote_left",),
-        inputs=[],
-        outputs=[feedback_state],
-        js=feedback_popup_vision_named_js.replace("{{VOTE_TYPE}}", "vote_left")
-    )
-    rightvote_btn.click(
-        lambda: ("vote_right",),
-        inputs=[],
-        outputs=[feedback_state],
-        js=feedback_popup_vision_named_js.replace("{{VOTE_TYPE}}", "vote_right")
-    )
-    tie_btn.click(
-        lambda: ("vote_tie",),
-        inputs=[],
-        outputs=[feedback_state],
-        js=feedback_popup_vision_named_js.replace("{{VOTE_TYPE}}", "vote_tie")
-    )
-    bothbad_btn.click(
-        lambda: ("vote_both_bad",),
-        inputs=[],
-        outputs=[feedback_state],
-        js=feedback_popup_vision_named_js.replace("{{VOTE_TYPE}}", "vote_both_bad")
-    )
-
+    # vote buttons only open the feedback popup, which submits via named_feedback_btn
+    for vote_btn, vote_type in [
+        (leftvote_btn, "vote_left"),
+        (rightvote_btn, "vote_right"),
+        (tie_btn, "vote_tie"),
+        (bothbad_btn, "vote_both_bad"),
+    ]:
+        vote_btn.click(
+            lambda vote_type=vote_type: (vote_type,),
+            inputs=[],
+            outputs=[feedback_state],
+            js=feedback_popup_vision_named_js.replace("{{VOTE_TYPE}}", vote_type)
+        )
 
     regenerate_btn.click(
         regenerate_multi,
@@ -1132,22 +1183,25 @@ For `npm` packages, you can use the format `npm (use '@' or 'latest') <package_n
         states + chatbots + [textbox] + user_buttons
     ).then(
         bot_response_multi,
-        states + [temperature, top_p, max_output_tokens] + sandbox_states,
-        states + chatbots + user_buttons,
+        bot_response_multi_inputs,
+        bot_response_multi_outputs,
     ).then(
         flash_buttons, [], user_buttons
     )
 
+    # shared by clear_btn and both model selectors
+    clear_history_outputs = (
+        sandbox_states
+        + states
+        + chatbots
+        + [multimodal_textbox, textbox]
+        + user_buttons
+    )
+
     clear_btn.click(
         clear_history,
         inputs=sandbox_states,
-        outputs=(
-            sandbox_states
-            + states
-            + chatbots
-            + [multimodal_textbox, textbox]
-            + user_buttons
-        ),
+        outputs=clear_history_outputs,
     ).then(
         clear_sandbox_components,
         inputs=[component for components in sandboxes_components for component in components],
@@ -1161,39 +1215,13 @@ For `npm` packages, you can use the format `npm (use '@' or 'latest') <package_n
         outputs=[examples_row, model_selectors[0], model_selectors[1]]
     )
 
-    share_js = """
-function (a, b, c, d) {
-    const captureElement = document.querySelector('#share-region-named');
-    html2canvas(captureElement)
-        .then(canvas => {
-            canvas.style.display = 'none'
-            document.body.appendChild(canvas)
-            return canvas
-        })
-        .then(canvas => {
-            const image = canvas.toDataURL('image/png')
-            const a = document.createElement('a')
-            a.setAttribute('download', 'chatbot-arena.png')
-            a.setAttribute('href', image)
-            a.click()
-            canvas.remove()
-        });
-    return [a, b, c, d];
-}
-"""
-    share_btn.click(share_click, states + model_selectors, [], js=share_js)
+    share_btn.click(share_click, states + model_selectors, [], js=share_js_vision_named)
 
     for i in range(num_sides):
         model_selectors[i].change(
             clear_history,
             inputs=sandbox_states,
-            outputs=(
-                sandbox_states
-                + states
-                + chatbots
-                + [multimodal_textbox, textbox]
-                + user_buttons
-            ),
+            outputs=clear_history_outputs,
         ).then(set_visible_image, [multimodal_textbox], [image_column])
 
     multimodal_textbox.input(
@@ -1206,8 +1234,8 @@ function (a, b, c, d) {
 
     multimodal_textbox.submit(
         add_text_multi,
-        inputs=states + model_selectors + sandbox_states + [multimodal_textbox, textbox] + [context_state],
-        outputs=states + chatbots + sandbox_states + [multimodal_textbox, textbox] + user_buttons,
+        inputs=add_text_multi_inputs,
+        outputs=add_text_multi_outputs,
     ).then(
         set_invisible_image, [], [image_column]
     ).then( # set the system prompt
@@ -1216,7 +1244,7 @@ function (a, b, c, d) {
         states + chatbots
     ).then(
         # hide the examples row and disable model selectors
-        lambda: [gr.update(visible=False), gr.update(interactive=False), gr.update(interactive=False)],
+        set_invisible_examples_and_selectors,
         outputs=[examples_row, model_selectors[0], model_selectors[1]]
     ).then(
         fn=lambda: [
@@ -1226,16 +1254,16 @@ function (a, b, c, d) {
         outputs=[system_prompt_textbox, sandbox_env_choice]
     ).then(
         bot_response_multi,
-        states + [temperature, top_p, max_output_tokens] + sandbox_states,
-        states + chatbots + user_buttons,
+        bot_response_multi_inputs,
+        bot_response_multi_outputs,
     ).then(
         flash_buttons, [], user_buttons
     )
 
     textbox.submit(
         add_text_multi,
-        inputs=states + model_selectors + sandbox_states + [multimodal_textbox, textbox] + [context_state],
-        outputs=states + chatbots + sandbox_states + [multimodal_textbox, textbox] + user_buttons,
+        inputs=add_text_multi_inputs,
+        outputs=add_text_multi_outputs,
     ).then(
         set_invisible_image, [], [image_column]
     ).then(
@@ -1245,7 +1273,7 @@ function (a, b, c, d) {
         states + chatbots
     ).then(
         # hide the examples row and disable model selectors
-        lambda: [gr.update(visible=False), gr.update(interactive=False), gr.update(interactive=False)],
+        set_invisible_examples_and_selectors,
         outputs=[examples_row, model_selectors[0], model_selectors[1]]
     ).then(
         fn=lambda: [
@@ -1255,16 +1283,16 @@ function (a, b, c, d) {
         outputs=[system_prompt_textbox, sandbox_env_choice]
     ).then(
         bot_response_multi,
-        states + [temperature, top_p, max_output_tokens] + sandbox_states,
-        states + chatbots + user_buttons,
+        bot_response_multi_inputs,
+        bot_response_multi_outputs,
     ).then(
         flash_buttons, [], user_buttons
     )
 
     send_btn.click(
         add_text_multi,
-        inputs=states + model_selectors + sandbox_states + [multimodal_textbox, textbox] + [context_state],
-        outputs=states + chatbots + sandbox_states + [multimodal_textbox, textbox] + user_buttons,
+        inputs=add_text_multi_inputs,
+        outputs=add_text_multi_outputs,
     ).then(
         set_invisible_image, [], [image_column]
     ).then(
@@ -1274,7 +1302,7 @@ function (a, b, c, d) {
         states + chatbots
     ).then(
         # hide examples row and disable model selectors
-        lambda: [gr.update(visible=False), gr.update(interactive=False), gr.update(interactive=False)],
+        set_invisible_examples_and_selectors,
         outputs=[examples_row, model_selectors[0], model_selectors[1]]
     ).then(
         fn=lambda: [
@@ -1284,8 +1312,8 @@ function (a, b, c, d) {
         outputs=[system_prompt_textbox, sandbox_env_choice]
     ).then(
         bot_response_multi,
-        states + [temperature, top_p, max_output_tokens] + sandbox_states,
-        states + chatbots + user_buttons,
+        bot_response_multi_inputs,
+        bot_response_multi_outputs,
     ).then(
         flash_buttons, [], user_buttons
     )
@@ -1337,7 +1365,7 @@ function (a, b, c, d) {
             [state, sandbox_state, model_selector],
             [state, chatbot]
         ).then(
-            lambda: gr.update(visible=False),
+            set_invisible_examples,
             inputs=None,
             outputs=examples_row
         ).then(
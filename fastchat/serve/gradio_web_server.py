@@ -4,17 +4,25 @@ The gradio demo server for chatting with a single model.
 
 import argparse
 from collections import defaultdict
+import functools
 import hashlib
-import json5
+import json
 import os
 import random
+import sys
 import time
 from typing import List
-from gradio_sandboxcomponent import SandboxComponent
 
+from fastapi.concurrency import iterate_in_threadpool, run_in_threadpool
 import gradio as gr
+import httpx
 import requests
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 from fastchat.constants import (
     WORKER_API_TIMEOUT,
     ErrorCode,
@@ -25,6 +33,8 @@ from fastchat.constants import (
     INPUT_CHAR_LEN_LIMIT,
     CONVERSATION_TURN_LIMIT,
     SESSION_EXPIRATION_TIME,
+    STREAM_FLUSH_INTERVAL,
+    STREAM_BATCH_MAX_SIZE,
     SURVEY_LINK,
 )
 from fastchat.conversation import Conversation
@@ -50,6 +60,15 @@ logger = build_logger("gradio_web_server", "gradio_web_server.log")
 
 headers = {"User-Agent": "FastChat Client"}
 
+# shared HTTP session, so controller and worker calls reuse keep-alive connections
+http_session = requests.Session()
+http_session.mount("http://", requests.adapters.HTTPAdapter(pool_connections=16, pool_maxsize=64))
+http_session.mount("https://", requests.adapters.HTTPAdapter(pool_connections=16, pool_maxsize=64))
+# async client for the calls made while streaming, so they don't hold a worker thread
+async_http_client = httpx.AsyncClient(
+    headers=headers, limits=httpx.Limits(max_connections=64), timeout=WORKER_API_TIMEOUT
+)
+
 no_change_btn = gr.Button()
 enable_btn = gr.Button(interactive=True, visible=True)
 disable_btn = gr.Button(interactive=False)
@@ -63,6 +82,18 @@ disable_text = gr.Textbox(
     placeholder='Press "🎲 New Round" to start over👇 (Note: Your vote shapes the leaderboard, please vote RESPONSIBLY!)',
 )
 
+# default system prompt, used when building the UI and on every clear
+_DEFAULT_SYS_PROMPT = DEFAULT_SANDBOX_INSTRUCTIONS[SandboxEnvironment.AUTO]
+# math delimiters rendered by the chatbot
+_LATEX_DELIMITERS = [
+    {"left": "$", "right": "$", "display": False},
+    {"left": "$$", "right": "$$", "display": True},
+    {"left": r"\(", "right": r"\)", "display": False},
+    {"left": r"\[", "right": r"\]", "display": True},
+]
+# initial sandbox state of the single model UI, gr.State deep copies it for each session
+_DEFAULT_SANDBOX_STATE = create_chatbot_sandbox_state(btn_list_length=5)
+
 controller_url = None
 enable_moderation = False
 use_remote_storage = False
@@ -112,6 +143,9 @@ We thank [E2B](https://e2b.dev/), [Hyperbolic](https://hyperbolic.xyz/), [Huggin
 
 api_endpoint_info = {}
 
+# sort key of registered models, following their registration order
+model_priority = {k: f"___{i:03d}" for i, k in enumerate(model_info)}
+
 def set_global_vars(
     controller_url_,
     enable_moderation_,
@@ -125,25 +159,46 @@ def set_global_vars(
 
 def get_model_list(controller_url, register_api_endpoint_file, vision_arena: bool):
     global api_endpoint_info
+    visible_models, models, api_endpoint_info = fetch_model_list(
+        controller_url, register_api_endpoint_file, vision_arena
+    )
+    return visible_models, models
+
+
+def fetch_model_list(
+    controller_url,
+    register_api_endpoint_file,
+    vision_arena: bool,
+    session: requests.Session = http_session,
+):
+    '''
+    Get the visible and all models, and the API endpoint info they were read with.
+    Unlike `get_model_list`, it leaves `api_endpoint_info` alone, so several lists can be
+    fetched at once, each thread with its own session.
+    '''
+    endpoint_info = api_endpoint_info
 
     # Add models from the controller
     if controller_url:
-        ret = requests.post(controller_url + "/refresh_all_workers")
+        ret = session.post(controller_url + "/refresh_all_workers")
         assert ret.status_code == 200
 
         if vision_arena:
-            ret = requests.post(controller_url + "/list_multimodal_models")
+            ret = session.post(controller_url + "/list_multimodal_models")
             models = ret.json()["models"]
         else:
-            ret = requests.post(controller_url + "/list_language_models")
+            ret = session.post(controller_url + "/list_language_models")
             models = ret.json()["models"]
     else:
         models = []
 
     # Add models from the API providers
     if register_api_endpoint_file:
-        api_endpoint_info = json5.load(open(register_api_endpoint_file))
-        for mdl, mdl_dict in api_endpoint_info.items():
+        # only needed for the endpoint registry, which is read once at startup
+        import json5
+
+        endpoint_info = json5.load(open(register_api_endpoint_file))
+        for mdl, mdl_dict in endpoint_info.items():
             mdl_vision = mdl_dict.get("vision-arena", False)
             mdl_text = mdl_dict.get("text-arena", True)
             if vision_arena and mdl_vision:
@@ -152,22 +207,20 @@ def get_model_list(controller_url, register_api_endpoint_file, vision_arena: boo
                 models.append(mdl)
 
     # Remove anonymous models
-    models = list(set(models))
-    visible_models = models.copy()
-    for mdl in models:
-        if mdl not in api_endpoint_info:
-            continue
-        mdl_dict = api_endpoint_info[mdl]
-        if mdl_dict["anony_only"]:
-            visible_models.remove(mdl)
+    # interned to share the model name strings of the sampling config
+    models = list(dict.fromkeys(map(sys.intern, models)))
+    anony_only_models = {
+        mdl for mdl, mdl_dict in endpoint_info.items() if mdl_dict.get("anony_only", False)
+    }
+    visible_models = [mdl for mdl in models if mdl not in anony_only_models]
 
     # Sort models and add descriptions
-    priority = {k: f"___{i:03d}" for i, k in enumerate(model_info)}
-    models.sort(key=lambda x: priority.get(x, x))
-    visible_models.sort(key=lambda x: priority.get(x, x))
+    sort_keys = {m: model_priority.get(m, m) for m in models}
+    models.sort(key=sort_keys.__getitem__)
+    visible_models.sort(key=sort_keys.__getitem__)
     logger.info(f"All models: {models}")
     logger.info(f"Visible models: {visible_models}")
-    return visible_models, models
+    return visible_models, models, endpoint_info
 
 
 def load_demo_single(context: Context, query_params):
@@ -280,14 +333,16 @@ def clear_sandbox_components(*components):
 def get_ip(request: gr.Request):
     if request is None:
         return None
-    if "cf-connecting-ip" in request.headers:
-        ip = request.headers["cf-connecting-ip"]
-    elif "x-forwarded-for" in request.headers:
-        ip = request.headers["x-forwarded-for"]
-        if "," in ip:
-            ip = ip.split(",")[0]
-    else:
-        ip = request.client.host
+    headers = request.headers
+    ip = headers.get("cf-connecting-ip")
+    if ip is None:
+        ip = headers.get("x-forwarded-for")
+        if ip is None:
+            return request.client.host
+        # keep the client address, the first entry of the proxy chain
+        comma = ip.find(",")
+        if comma >= 0:
+            ip = ip[:comma]
     return ip
 
 def set_chat_system_messages(state, sandbox_state, model_selector):
@@ -348,8 +403,7 @@ def add_text(
             + (no_change_btn,) * sandbox_state["btn_list_length"]
         )
 
-    all_conv_text = state.conv.get_prompt()
-    all_conv_text = all_conv_text[-2000:] + "\nuser: " + text
+    all_conv_text = "".join((state.conv.get_prompt_tail(2000), "\nuser: ", text))
     flagged = moderation_filter(all_conv_text, [state.model_name])
     # flagged = moderation_filter(text, [state.model_name])
     if flagged:
@@ -364,7 +418,8 @@ def add_text(
             no_change_btn,
         ) * sandbox_state["btn_list_length"]
 
-    text = text[:INPUT_CHAR_LEN_LIMIT]  # Hard cut-off
+    if len(text) > INPUT_CHAR_LEN_LIMIT:
+        text = text[:INPUT_CHAR_LEN_LIMIT]  # Hard cut-off
     state.conv.append_message(state.conv.roles[0], text)
     state.conv.append_message(state.conv.roles[1], None)
 
@@ -376,7 +431,47 @@ def add_text(
     ) + (disable_btn,) * sandbox_state["btn_list_length"]
 
 
-def model_worker_stream_iter(
+def loads_worker_chunk(chunk: bytes | memoryview):
+    '''
+    Parse one JSON chunk streamed by a model worker.
+    '''
+    if orjson is not None:
+        try:
+            return orjson.loads(chunk)
+        except orjson.JSONDecodeError:
+            # e.g. NaN values, which only the stdlib parser accepts
+            pass
+    if isinstance(chunk, memoryview):
+        chunk = chunk.tobytes()
+    return json.loads(chunk)
+
+
+async def iter_worker_chunks(response: httpx.Response):
+    '''
+    Parse the NUL delimited JSON chunks of a model worker stream.
+    Reads the response in blocks as they arrive instead of line by line.
+    '''
+    buf = bytearray()
+    async for data in response.aiter_bytes():
+        buf += data
+        records = []
+        start = 0
+        with memoryview(buf) as view:
+            idx = buf.find(b"\0")
+            while idx >= 0:
+                if idx > start:
+                    records.append(loads_worker_chunk(view[start:idx]))
+                start = idx + 1
+                idx = buf.find(b"\0", start)
+        # the view must be released before the buffer can be resized
+        del buf[:start]
+        for record in records:
+            yield record
+    if buf.strip():
+        yield loads_worker_chunk(buf)
+
+
+async def model_worker_stream_iter(
     conv,
     model_name,
     worker_addr,
@@ -406,24 +501,20 @@ def model_worker_stream_iter(
         gen_params["images"] = images
 
     # Stream output
-    response = requests.post(
+    async with async_http_client.stream(
+        "POST",
         worker_addr + "/worker_generate_stream",
-        headers=headers,
         json=gen_params,
-        stream=True,
-        timeout=WORKER_API_TIMEOUT,
-    )
-    for chunk in response.iter_lines(decode_unicode=False, delimiter=b"\0"):
-        if chunk:
-            data = json5.loads(chunk.decode())
-            yield data
+    ) as response:
+        async for chunk in iter_worker_chunks(response):
+            yield chunk
 
 
 def is_limit_reached(model_name, ip):
     # Disable limit check for now
     # monitor_url = "http://localhost:9090"
     # try:
-    #     ret = requests.get(
+    #     ret = http_session.get(
     #         f"{monitor_url}/is_limit_reached?model={model_name}&user_id={ip}", timeout=1
     #     )
     #     obj = ret.json()
@@ -434,7 +525,34 @@ def is_limit_reached(model_name, ip):
     return None
 
 
-def bot_response(
+class TokenBatcher:
+    '''
+    Batches streamed chunks so the chatbot is only re-rendered once per batch.
+    A batch ends after `max_size` chunks or `wait` seconds since the last flush.
+    '''
+
+    def __init__(self, max_size: int = STREAM_BATCH_MAX_SIZE, wait: float = STREAM_FLUSH_INTERVAL):
+        self.max_size = max_size
+        self.wait = wait
+        self.size = 0
+        # the first chunk is flushed right away
+        self.last_flush_time = 0.0
+
+    def add(self) -> bool:
+        '''
+        Add a chunk to the current batch.
+        Returns whether the batch is complete and should be flushed now.
+        '''
+        self.size += 1
+        now = time.monotonic()
+        if self.size < self.max_size and now - self.last_flush_time < self.wait:
+            return False
+        self.size = 0
+        self.last_flush_time = now
+        return True
+
+
+async def bot_response(
     state: ModelChatState,
     temperature,
     top_p,
@@ -446,9 +564,10 @@ def bot_response(
 ):
     '''
     The main function for generating responses from the model.
+    Runs on the event loop; blocking calls are moved to the thread pool.
     '''
+    ip = get_ip(request)
     if request:
-        ip = get_ip(request)
         logger.info(f"bot_response. ip: {ip}")
 
     start_tstamp = time.time()
@@ -456,14 +575,20 @@ def bot_response(
     top_p = float(top_p)
     max_new_tokens = int(max_new_tokens)
 
+    # button updates shared by every yield below
+    btn_list_length = sandbox_state["btn_list_length"]
+    no_change_btns = (no_change_btn,) * btn_list_length
+    disabled_btns = (disable_btn,) * btn_list_length
+    enabled_btns = (enable_btn,) * btn_list_length
+
     if state is None:
-        yield (None, None) + (no_change_btn,) * sandbox_state["btn_list_length"]
+        yield (None, None) + no_change_btns
         return
 
     if state.skip_next:
         # This generate call is skipped due to invalid inputs
         state.skip_next = False
-        yield (state, state.to_gradio_chatbot()) + (no_change_btn,) * sandbox_state["btn_list_length"]
+        yield (state, state.to_gradio_chatbot()) + no_change_btns
         return
 
     if apply_rate_limit:
@@ -472,21 +597,20 @@ def bot_response(
             error_msg = RATE_LIMIT_MSG + "\n\n" + ret["reason"]
             logger.info(f"rate limit reached. ip: {ip}. error_msg: {ret['reason']}")
             state.conv.update_last_message(error_msg)
-            yield (state, state.to_gradio_chatbot()) + (no_change_btn,) * sandbox_state["btn_list_length"]
+            yield (state, state.to_gradio_chatbot()) + no_change_btns
             return
 
     conv: Conversation = state.conv
     model_name: str = state.model_name
 
-    model_api_dict = (
-        api_endpoint_info[model_name] if model_name in api_endpoint_info else None
-    )
-    images = conv.get_images()
+    model_api_dict = api_endpoint_info.get(model_name)
+    # loading the images can read files and fetch URLs
+    images = await run_in_threadpool(conv.get_images)
 
     if model_api_dict is None:
         # if not API-based model, use worker
         # Query worker address
-        ret = requests.post(
+        ret = await async_http_client.post(
             controller_url + "/get_worker_address", json={"model": model_name}
         )
         worker_addr = ret.json()["address"]
@@ -495,11 +619,7 @@ def bot_response(
         # No available worker
         if worker_addr == "":
             conv.update_last_message(SERVER_ERROR_MSG)
-            yield (
-                state,
-                state.to_gradio_chatbot(),
-                (disable_btn,) * sandbox_state["btn_list_length"],
-            )
+            yield (state, state.to_gradio_chatbot()) + disabled_btns
             return
 
         # Construct prompt.
@@ -538,37 +658,60 @@ def bot_response(
                     "max_new_tokens", max_new_tokens
                 )
 
-        stream_iter = get_api_provider_stream_iter(
-            conv,
-            model_name,
-            model_api_dict,
-            temperature,
-            top_p,
-            max_new_tokens,
-            state,
+        # the API providers use blocking clients, and building their messages encodes the
+        # images, so build the iterator and pull its chunks in the thread pool
+        stream_iter = iterate_in_threadpool(
+            await run_in_threadpool(
+                get_api_provider_stream_iter,
+                conv,
+                model_name,
+                model_api_dict,
+                temperature,
+                top_p,
+                max_new_tokens,
+                state,
+            )
         )
 
     html_code = ' <span class="cursor"></span> '
 
     # conv.update_last_message("▌")
     if conv is None:
-        yield (state, None) + (no_change_btn,) * sandbox_state["btn_list_length"]
+        yield (state, None) + no_change_btns
         return
     conv.update_last_message(html_code)
-    yield (state, state.to_gradio_chatbot()) + (disable_btn,) * (sandbox_state["btn_list_length"])
+    yield (state, state.to_gradio_chatbot()) + disabled_btns
 
     try:
         log_data = {"text": ""}
-        for i, log_data in enumerate(stream_iter):
+        batcher = TokenBatcher()
+        # running count of ``` in the streamed text, same as text.count("```") on the final text
+        code_fence_count, fence_scan_pos, scanned_len = 0, 0, 0
+        async for log_data in stream_iter:
             if log_data["error_code"] == 0:
-                output = log_data["text"].strip()
+                text = log_data["text"]
+                if len(text) < scanned_len:
+                    # the text was rewritten rather than extended, count from scratch
+                    code_fence_count, fence_scan_pos = 0, 0
+                scanned_len = len(text)
+                pos = text.find("```", fence_scan_pos)
+                while pos >= 0:
+                    code_fence_count += 1
+                    fence_scan_pos = pos + 3
+                    pos = text.find("```", fence_scan_pos)
+                # a fence may still be completed by the next chunk
+                fence_scan_pos = max(fence_scan_pos, scanned_len - 2)
+                output = text.strip()
+                # the full output is always sent after the stream ends
+                if not batcher.add():
+                    continue
                 conv.update_last_message(output + "▌")
                 # conv.update_last_message(output + html_code)
-                yield (state, state.to_gradio_chatbot()) + (disable_btn,) * sandbox_state["btn_list_length"]
+                yield (state, state.to_gradio_chatbot_incremental()) + disabled_btns
             else:
                 output = log_data["text"] + f"\n\n(error_code: {log_data['error_code']})"
                 conv.update_last_message(output)
-                yield (state, state.to_gradio_chatbot()) + (disable_btn,) * (sandbox_state["btn_list_length"]-2) + (enable_btn, enable_btn)
+                yield (state, state.to_gradio_chatbot()) + disabled_btns[:-2] + (enable_btn, enable_btn)
                 return
         output = log_data["text"].strip()
         conv.update_last_message(output)
@@ -577,31 +720,32 @@ def bot_response(
         if sandbox_state is not None and sandbox_state["enable_sandbox"]:
             last_message = conv.messages[-1]
             # Count occurrences of ``` to ensure code blocks are properly closed
-            code_fence_count = last_message[1].count("```")
             if code_fence_count > 0 and code_fence_count % 2 == 0:  # Even number means closed code blocks
                 if not last_message[1].endswith(RUN_CODE_BUTTON_HTML):
                     last_message[1] += "\n\n\n" + RUN_CODE_BUTTON_HTML
 
-        yield (state, state.to_gradio_chatbot()) + (enable_btn,) * sandbox_state["btn_list_length"]
-    except requests.exceptions.RequestException as e:
+        yield (state, state.to_gradio_chatbot()) + enabled_btns
+    except (requests.exceptions.RequestException, httpx.HTTPError) as e:
         conv.update_last_message(
             f"{SERVER_ERROR_MSG}\n\n"
             f"(error_code: {ErrorCode.GRADIO_REQUEST_ERROR}, {e})"
         )
-        yield (state, state.to_gradio_chatbot()) + (enable_btn,) * sandbox_state["btn_list_length"]
+        yield (state, state.to_gradio_chatbot()) + enabled_btns
         return
     except Exception as e:
         conv.update_last_message(
             f"{SERVER_ERROR_MSG}\n\n"
             f"(error_code: {ErrorCode.GRADIO_STREAM_UNKNOWN_ERROR}, {e})"
         )
-        yield (state, state.to_gradio_chatbot()) + (enable_btn,) * sandbox_state["btn_list_length"]
+        yield (state, state.to_gradio_chatbot()) + enabled_btns
         return
 
     logger.info(f"{output}")
 
-    conv.save_new_images(
-        has_csam_images=state.has_csam_image, use_remote_storage=use_remote_storage
+    await run_in_threadpool(
+        conv.save_new_images,
+        has_csam_images=state.has_csam_image,
+        use_remote_storage=use_remote_storage,
     )
 
     # Log the conversation
@@ -614,13 +758,54 @@ def bot_response(
         },
         start_ts=start_tstamp,
         end_ts=time.time(),
-        ip=get_ip(request),
+        ip=ip,
     )
     get_remote_logger().log(log_data)
     save_log_to_local(log_data, local_filepath)
     # save_conv_log_to_azure_storage(local_filepath.lstrip(LOCAL_LOG_DIR), log_data)
 
 
+async def submit_text(
+    state: ModelChatState,
+    model_selector: str,
+    sandbox_state: ChatbotSandboxState,
+    text: str,
+    system_prompt: str,
+    temperature,
+    top_p,
+    max_new_tokens,
+    request: gr.Request,
+):
+    '''
+    Add the user message and stream the model response in a single event.
+    Yields state, chatbot, buttons, textbox, system prompt, env choice, examples row and sandbox state.
+    '''
+    sandbox_state = update_system_prompt(system_prompt, sandbox_state)
+    # moderation is a blocking HTTP call
+    state, _, textbox, *btns = await run_in_threadpool(
+        add_text, state, model_selector, sandbox_state, text, request
+    )
+    state, chatbot, environment_instruction = set_chat_system_messages(
+        state, sandbox_state, model_selector
+    )
+    # disable env and prompt change, hide examples
+    ui_updates = (
+        textbox,
+        gr.update(value=environment_instruction, interactive=False),
+        gr.update(interactive=False),
+        gr.update(visible=False),
+        sandbox_state,
+    )
+    # keep the buttons add_text chose, which are left unchanged when the submit is skipped
+    yield (state, chatbot) + tuple(btns) + ui_updates
+
+    ui_skips = (gr.skip(),) * len(ui_updates)
+    async for ret in bot_response(
+        state, temperature, top_p, max_new_tokens, sandbox_state, request
+    ):
+        yield ret + ui_skips
+
+
 block_css = """
 .prose {
     font-size: 105% !important;
@@ -796,6 +981,11 @@ The css block is used to style the chatbot interface.
 
 
 def get_model_description_md(models):
+    return _get_model_description_md(tuple(models))
+
+
+@functools.lru_cache(maxsize=64)
+def _get_model_description_md(models: tuple[str, ...]):
     model_description_md = """
 | | | |
 | ---- | ---- | ---- |
@@ -871,6 +1061,8 @@ We thank [E2B](https://e2b.dev/), [Hyperbolic](https://hyperbolic.xyz/), [Huggin
 
 
 def build_single_model_ui(models, add_promotion_links=False):
+    from gradio_sandboxcomponent import SandboxComponent
+
     promotion = (
         f"""
 ## 👇 Chat Now!
@@ -903,12 +1095,7 @@ def build_single_model_ui(models, add_promotion_links=False):
             label="Scroll down and start chatting",
             height=650,
             show_copy_button=True,
-            latex_delimiters=[
-                {"left": "$", "right": "$", "display": False},
-                {"left": "$$", "right": "$$", "display": True},
-                {"left": r"\(", "right": r"\)", "display": False},
-                {"left": r"\[", "right": r"\]", "display": True},
-            ],
+            latex_delimiters=_LATEX_DELIMITERS,
         )
 
     # Sandbox state and components
@@ -931,7 +1118,7 @@ def build_single_model_ui(models, add_promotion_links=False):
             open=False
         ) as system_prompt_accordion:
                 system_prompt_textbox = gr.Textbox(
-                    value=DEFAULT_SANDBOX_INSTRUCTIONS[SandboxEnvironment.AUTO],
+                    value=_DEFAULT_SYS_PROMPT,
                     show_label=False,
                     lines=15,
                     placeholder="Edit system prompt here",
@@ -943,7 +1130,7 @@ def build_single_model_ui(models, add_promotion_links=False):
             with gr.Accordion("Sandbox & Output", open=True, visible=True) as sandbox_instruction_accordion:
                 with gr.Group(visible=True) as sandbox_group:
                     with gr.Column(visible=True, scale=1) as sandbox_column:
-                        sandbox_state = gr.State(create_chatbot_sandbox_state(btn_list_length=5))
+                        sandbox_state = gr.State(_DEFAULT_SANDBOX_STATE)
                         # Add containers for the sandbox output
                         sandbox_title = gr.Markdown(value=f"### Model Sandbox", visible=True)
 
@@ -1133,7 +1320,7 @@ def build_single_model_ui(models, add_promotion_links=False):
         # reset env and system prompt
         lambda: (
             gr.update(interactive=True, value=SandboxEnvironment.AUTO),
-            gr.update(interactive=True, value=DEFAULT_SANDBOX_INSTRUCTIONS[SandboxEnvironment.AUTO])
+            gr.update(interactive=True, value=_DEFAULT_SYS_PROMPT)
         ),
         outputs=[sandbox_env_choice, system_prompt_textbox]
     ).then(
@@ -1159,56 +1346,16 @@ def build_single_model_ui(models, add_promotion_links=False):
         outputs=[system_prompt_textbox, sandbox_env_choice]
     )
 
-    textbox.submit(
-        update_system_prompt,
-        inputs=[system_prompt_textbox, sandbox_state],
-        outputs=[sandbox_state]
-    ).then(
-        add_text,
-        [state, model_selector, sandbox_state, textbox],
-        [state, chatbot, textbox] + btn_list,
-    ).then(
-        set_chat_system_messages,
-        inputs=[state, sandbox_state, model_selector],
-        outputs=[state, chatbot, system_prompt_textbox]
-    ).then(
-        # hide examples
-        lambda: gr.update(visible=False),
-        outputs=examples_row
-    ).then(
-        # disable env and prompt change
-        lambda: (gr.update(interactive=False),) * 2,
-        outputs=[sandbox_env_choice, system_prompt_textbox]
-    ).then(
-        bot_response,
-        [state, temperature, top_p, max_output_tokens, sandbox_state],
-        [state, chatbot] + btn_list,
-    )
-
-    send_btn.click(
-        update_system_prompt,
-        inputs=[system_prompt_textbox, sandbox_state],
-        outputs=[sandbox_state]
-    ).then(
-        add_text,
-        [state, model_selector, sandbox_state, textbox],
-        [state, chatbot, textbox] + btn_list,
-    ).then(
-        set_chat_system_messages,
-        [state, sandbox_state, model_selector],
-        [state, chatbot, system_prompt_textbox]
-    ).then(
-        # disable env and prompt change
-        lambda: (gr.update(interactive=False),) * 2,
-        outputs=[system_prompt_textbox, sandbox_env_choice]
-    ).then(
-        lambda: gr.update(visible=False),
-        outputs=examples_row
-    ).then(
-        bot_response,
-        [state, temperature, top_p, max_output_tokens, sandbox_state],
-        [state, chatbot] + btn_list,
-    )
+    # add the message and stream the response in one event to save round trips
+    submit_text_inputs = [
+        state, model_selector, sandbox_state, textbox, system_prompt_textbox,
+        temperature, top_p, max_output_tokens,
+    ]
+    submit_text_outputs = [state, chatbot] + btn_list + [
+        textbox, system_prompt_textbox, sandbox_env_choice, examples_row, sandbox_state,
+    ]
+    textbox.submit(submit_text, submit_text_inputs, submit_text_outputs)
+    send_btn.click(submit_text, submit_text_inputs, submit_text_outputs)
 
     sandbox_env_choice.change(
         fn=update_sandbox_config,
@@ -1250,6 +1397,7 @@ def build_demo(models) -> gr.Blocks:
         title="SWE Arena: Compare & Test Best AI Chatbots for Code",
         theme=gr.themes.Default(),
         css=block_css,
+        analytics_enabled=False,
     ) as demo:
         url_params = gr.JSON(visible=False)
 
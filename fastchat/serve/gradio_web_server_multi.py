@@ -4,12 +4,14 @@ It supports chatting with a single model or chatting with two models side-by-sid
 """
 
 import argparse
-import pickle
+from concurrent.futures import ThreadPoolExecutor
 import time
 from typing import List
 
 import gradio as gr
+import requests
 
+from fastchat.serve import gradio_web_server
 from fastchat.serve.gradio_block_arena_anony import (
     build_side_by_side_ui_anony,
     load_demo_side_by_side_anony,
@@ -20,17 +22,6 @@ from fastchat.serve.gradio_block_arena_named import (
     load_demo_side_by_side_named,
     set_global_vars_named,
 )
-from fastchat.serve.gradio_block_arena_vision import (
-    build_single_vision_language_model_ui,
-)
-from fastchat.serve.gradio_block_arena_vision_anony import (
-    build_side_by_side_vision_ui_anony,
-    load_demo_side_by_side_vision_anony,
-)
-from fastchat.serve.gradio_block_arena_vision_named import (
-    build_side_by_side_vision_ui_named,
-    load_demo_side_by_side_vision_named,
-)
 from fastchat.serve.gradio_global_state import Context
 
 from fastchat.serve.gradio_web_server import (
@@ -38,7 +29,7 @@ from fastchat.serve.gradio_web_server import (
     block_css,
     build_single_model_ui,
     build_about,
-    get_model_list,
+    fetch_model_list,
     load_demo_single,
     get_ip,
 )
@@ -53,40 +44,67 @@ from fastchat.utils import (
 
 logger = build_logger("gradio_web_server_multi", "gradio_web_server_multi.log")
 
+# tab selected by a url param, the first matching param wins
+query_param_tabs = {
+    "arena": 0,
+    "vision": 0,
+    "compare": 1,
+    "direct": 2,
+    "model": 2,
+    "leaderboard": 3,
+    "about": 4,
+}
+
+# the model lists shared by all sessions, keyed by the id kept in each session's state
+contexts: dict[int, Context] = {}
+
+
+def get_text_and_vision_model_lists(controller_url, register_api_endpoint_file):
+    '''
+    Fetch the text and vision model lists in parallel.
+    Returns (text_models, all_text_models), (vision_models, all_vision_models).
+    '''
+    def fetch(vision_arena: bool):
+        # requests sessions are not thread-safe, so each fetch gets its own
+        with requests.Session() as session:
+            return fetch_model_list(
+                controller_url, register_api_endpoint_file, vision_arena, session
+            )
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        text_future = executor.submit(fetch, False)
+        vision_future = executor.submit(fetch, True)
+        text_models, all_text_models, text_endpoint_info = text_future.result()
+        vision_models, all_vision_models, vision_endpoint_info = vision_future.result()
+    # both lists are read from the same registry, only the main thread updates the global
+    gradio_web_server.api_endpoint_info = {**text_endpoint_info, **vision_endpoint_info}
+    return (text_models, all_text_models), (vision_models, all_vision_models)
+
 
-def load_demo(context: Context, request: gr.Request):
+def load_demo(context_id: int, request: gr.Request):
+    context = contexts[context_id]
     ip = get_ip(request)
     logger.info(f"load_demo. ip: {ip}. params: {request.query_params}")
 
-    inner_selected = 0
-    if "arena" in request.query_params:
-        inner_selected = 0
-    elif "vision" in request.query_params:
-        inner_selected = 0
-    elif "compare" in request.query_params:
-        inner_selected = 1
-    elif "direct" in request.query_params or "model" in request.query_params:
-        inner_selected = 2
-    elif "leaderboard" in request.query_params:
-        inner_selected = 3
-    elif "about" in request.query_params:
-        inner_selected = 4
+    query_params = request.query_params
+    inner_selected = next(
+        (tab for param, tab in query_param_tabs.items() if param in query_params), 0
+    )
 
     if args.model_list_mode == "reload":
-        context.text_models, context.all_text_models = get_model_list(
-            args.controller_url,
-            args.register_api_endpoint_file,
-            vision_arena=False,
-        )
-
-        context.vision_models, context.all_vision_models = get_model_list(
-            args.controller_url,
-            args.register_api_endpoint_file,
-            vision_arena=True,
+        (
+            (context.text_models, context.all_text_models),
+            (context.vision_models, context.all_vision_models),
+        ) = get_text_and_vision_model_lists(
+            args.controller_url, args.register_api_endpoint_file
         )
 
     # Text models
     if args.vision_arena:
+        from fastchat.serve.gradio_block_arena_vision_anony import (
+            load_demo_side_by_side_vision_anony,
+        )
+
         side_by_side_anony_updates = load_demo_side_by_side_vision_anony()
 
         # side_by_side_named_updates = load_demo_side_by_side_vision_named(
@@ -121,9 +139,8 @@ def build_demo(
     else:
         load_js = get_window_url_params_js
 
-    head_js = """
-<script src="https://cdnjs.cloudflare.com/ajax/libs/html2canvas/1.4.1/html2canvas.min.js"></script>
-"""
+    # html2canvas is fetched by the share buttons on first use
+    head_js = ""
     if args.ga_id is not None:
         head_js += f"""
 <script async src="https://www.googletagmanager.com/gtag/js?id={args.ga_id}"></script>
@@ -142,6 +159,7 @@ window.__gradio_mode__ = "app";
         theme=gr.themes.Default(text_size=text_size),
         css=block_css,
         head=head_js,
+        analytics_enabled=False,
     ) as demo:
         gr.Markdown("""
 <h2 style="text-align:center;">
@@ -160,6 +178,11 @@ window.__gradio_mode__ = "app";
                     """)
         with gr.Tabs() as inner_tabs:
             if args.vision_arena:
+                # the vision tabs are only imported when the vision arena is served
+                from fastchat.serve.gradio_block_arena_vision_anony import (
+                    build_side_by_side_vision_ui_anony,
+                )
+
                 with gr.Tab("⚔️ Chat2Prototype", id=0) as arena_tab:
                     arena_tab.select(None, None, None, js=load_js)
                     side_by_side_anony_list = build_side_by_side_vision_ui_anony(
@@ -218,7 +241,9 @@ window.__gradio_mode__ = "app";
             with gr.Tab("ℹ️ About Us", id=4):
                 about = build_about()
 
-        context_state = gr.State(context)
+        # sessions only keep the context id, so gr.State doesn't deep copy the model lists
+        contexts[id(context)] = context
+        context_state = gr.State(id(context))
         url_params = gr.JSON(visible=False)
 
         if args.model_list_mode not in ["once", "reload"]:
@@ -327,24 +352,16 @@ if __name__ == "__main__":
     set_global_vars(args.controller_url, args.moderate, args.use_remote_storage)
     set_global_vars_named(args.moderate)
     set_global_vars_anony(args.moderate)
-    text_models, all_text_models = get_model_list(
-        args.controller_url,
-        args.register_api_endpoint_file,
-        vision_arena=False,
-    )
-
-    vision_models, all_vision_models = get_model_list(
-        args.controller_url,
-        args.register_api_endpoint_file,
-        vision_arena=True,
+    (
+        (text_models, all_text_models),
+        (vision_models, all_vision_models),
+    ) = get_text_and_vision_model_lists(
+        args.controller_url, args.register_api_endpoint_file
     )
 
-    models = text_models + [
-        model for model in vision_models if model not in text_models
-    ]
-    all_models = all_text_models + [
-        model for model in all_vision_models if model not in all_text_models
-    ]
+    # merge in order, text models first
+    models = list(dict.fromkeys(text_models + vision_models))
+    all_models = list(dict.fromkeys(all_text_models + all_vision_models))
     context = Context(
         text_models,
         all_text_models,
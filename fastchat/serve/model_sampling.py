@@ -1,7 +1,26 @@
 '''
 Model sampling configuration.
+
+To draw with `random.choices`, pass the precomputed `SAMPLING_POPULATION` and
+`SAMPLING_CUM_WEIGHTS` (or their `VISION_` counterparts) as the population and `cum_weights=`,
+rather than `SAMPLING_WEIGHTS` as `weights=`, which is accumulated again on every call.
 '''
 
+import bisect
+import functools
+import itertools
+import json
+import logging
+import os
+import random
+import sys
+from types import MappingProxyType
+from typing import Iterable, Mapping, NamedTuple, Optional, Sequence
+
+
+logger = logging.getLogger(__name__)
+
+
 SAMPLING_WEIGHTS = {
     'gpt-4o-mini-2024-07-18': 1,
     'gpt-4o-2024-11-20': 1,
@@ -36,12 +55,16 @@ BATTLE_TARGETS = {}
 
 BATTLE_STRICT_TARGETS = {}
 
-ANON_MODELS = []
+# frozensets, these are only used for membership checks
+ANON_MODELS = frozenset()
 
-SAMPLING_BOOST_MODELS = []
+SAMPLING_BOOST_MODELS = frozenset()
+
+# sampling weights of boosted models are multiplied by this.
+SAMPLING_BOOST_FACTOR = 5
 
 # outage models won't be sampled.
-OUTAGE_MODELS = []
+OUTAGE_MODELS = frozenset()
 
 
 # TODO(chris): fix sampling weights
@@ -61,7 +84,192 @@ VISION_SAMPLING_WEIGHTS = {
 VISION_BATTLE_TARGETS = {}
 
 # TODO(chris): Fill out models that require sampling boost
-VISION_SAMPLING_BOOST_MODELS = []
+VISION_SAMPLING_BOOST_MODELS = frozenset()
 
 # outage models won't be sampled.
-VISION_OUTAGE_MODELS = []
\ No newline at end of file
+VISION_OUTAGE_MODELS = frozenset()
+
+# Optional JSON file overriding the config above, so weights and outages can be changed without
+# a code change. Its keys are "sampling", "vision", "outage" and "vision_outage", all optional.
+SAMPLING_CONFIG_FILE = os.getenv("SAMPLING_CONFIG_FILE")
+if SAMPLING_CONFIG_FILE:
+    with open(SAMPLING_CONFIG_FILE) as f:
+        _config = json.load(f)
+    SAMPLING_WEIGHTS = _config.get("sampling", SAMPLING_WEIGHTS)
+    VISION_SAMPLING_WEIGHTS = _config.get("vision", VISION_SAMPLING_WEIGHTS)
+    OUTAGE_MODELS = frozenset(_config.get("outage", OUTAGE_MODELS))
+    VISION_OUTAGE_MODELS = frozenset(_config.get("vision_outage", VISION_OUTAGE_MODELS))
+    del _config
+
+# Intern the model names, so lookups of names that are interned too, like the ones from
+# `get_model_list`, compare by identity. Model names fed to the sampler should be interned.
+# The weights are read-only views, so they can be shared without copies and the tables derived
+# from them below can't go stale. They are sorted by decreasing weight, so linear scans over
+# the cumulative weights stop early on the likely models; the sort is stable for equal weights.
+SAMPLING_WEIGHTS = MappingProxyType(
+    {sys.intern(k): v for k, v in sorted(SAMPLING_WEIGHTS.items(), key=lambda kv: -kv[1])}
+)
+VISION_SAMPLING_WEIGHTS = MappingProxyType(
+    {sys.intern(k): v for k, v in sorted(VISION_SAMPLING_WEIGHTS.items(), key=lambda kv: -kv[1])}
+)
+ANON_MODELS = frozenset(map(sys.intern, ANON_MODELS))
+SAMPLING_BOOST_MODELS = frozenset(map(sys.intern, SAMPLING_BOOST_MODELS))
+OUTAGE_MODELS = frozenset(map(sys.intern, OUTAGE_MODELS))
+VISION_SAMPLING_BOOST_MODELS = frozenset(map(sys.intern, VISION_SAMPLING_BOOST_MODELS))
+VISION_OUTAGE_MODELS = frozenset(map(sys.intern, VISION_OUTAGE_MODELS))
+
+
+class AliasTable(NamedTuple):
+    '''
+    Walker alias table, draws a model with probability proportional to its weight in O(1).
+    '''
+
+    keys: tuple[str, ...]
+    '''
+    The models.
+    '''
+
+    prob: tuple[float, ...]
+    '''
+    Probability of keeping the drawn bucket instead of taking its alias.
+    '''
+
+    alias: tuple[int, ...]
+    '''
+    Index of the model that fills the rest of each bucket.
+    '''
+
+
+def build_alias_table(weights: Mapping[str, float]) -> AliasTable:
+    '''
+    Build an alias table from model weights with Vose's method.
+    '''
+    keys = tuple(weights)
+    n = len(keys)
+    total = sum(weights.values())
+    if total <= 0:
+        raise ValueError("No model with a positive sampling weight")
+    scaled = [weight * n / total for weight in weights.values()]
+    prob = [1.0] * n
+    alias = list(range(n))
+    small = [i for i, p in enumerate(scaled) if p < 1.0]
+    large = [i for i, p in enumerate(scaled) if p >= 1.0]
+    while small and large:
+        s, l = small.pop(), large.pop()
+        prob[s], alias[s] = scaled[s], l
+        scaled[l] += scaled[s] - 1.0
+        (small if scaled[l] < 1.0 else large).append(l)
+    # buckets left in either list are full up to rounding, their prob stays 1
+    return AliasTable(keys, tuple(prob), tuple(alias))
+
+
+def sample_alias(table: AliasTable, rng: random.Random = random) -> str:
+    '''
+    Draw a model from an alias table.
+    '''
+    i = int(rng.random() * len(table.keys))
+    if rng.random() < table.prob[i]:
+        return table.keys[i]
+    return table.keys[table.alias[i]]
+
+
+def build_cum_weights(weights: Mapping[str, float]) -> tuple[list[str], list[float]]:
+    '''
+    Get the models and their cumulative weights, as taken by `sample_cum_weights`.
+    '''
+    return list(weights), list(itertools.accumulate(weights.values()))
+
+
+def sample_cum_weights(
+    keys: Sequence[str], cum_weights: Sequence[float], rng: random.Random = random
+) -> str:
+    '''
+    Draw a model by bisecting its cumulative weights, O(log N).
+    Cheaper to set up than an alias table, for tables that are only drawn from a few times.
+    '''
+    return keys[bisect.bisect_right(cum_weights, rng.random() * cum_weights[-1])]
+
+
+def is_uniform(weights: Mapping[str, float]) -> bool:
+    '''
+    Whether all models have the same positive weight, so a model can be drawn by index alone.
+    '''
+    values = list(weights.values())
+    return bool(values) and values[0] > 0 and all(v == values[0] for v in values)
+
+
+SAMPLING_POPULATION = tuple(SAMPLING_WEIGHTS)
+SAMPLING_CUM_WEIGHTS = tuple(itertools.accumulate(SAMPLING_WEIGHTS.values()))
+VISION_SAMPLING_POPULATION = tuple(VISION_SAMPLING_WEIGHTS)
+VISION_SAMPLING_CUM_WEIGHTS = tuple(itertools.accumulate(VISION_SAMPLING_WEIGHTS.values()))
+
+
+@functools.lru_cache(maxsize=8)
+def build_effective_alias_table(
+    weights: tuple[tuple[str, float], ...],
+    outage_models: frozenset[str],
+    boost_models: frozenset[str],
+) -> Optional[AliasTable]:
+    '''
+    Build the alias table of the weights left after dropping outage models and boosting boost models.
+    Memoized on the outage and boost sets, so it is only rebuilt when they change.
+    None if no model with a positive weight is left.
+    '''
+    effective_weights = {
+        model: weight * SAMPLING_BOOST_FACTOR if model in boost_models else weight
+        for model, weight in weights
+        if model not in outage_models
+    }
+    if sum(effective_weights.values()) <= 0:
+        logger.warning("No model with a positive sampling weight is left out of outage")
+        return None
+    return build_alias_table(effective_weights)
+
+
+_SAMPLING_ITEMS = tuple(SAMPLING_WEIGHTS.items())
+_VISION_ITEMS = tuple(VISION_SAMPLING_WEIGHTS.items())
+
+
+def get_sampler(vision: bool = False) -> Optional[AliasTable]:
+    '''
+    Get the alias table for the current outage and boost models, None if all models are out.
+    '''
+    if vision:
+        return build_effective_alias_table(
+            _VISION_ITEMS, VISION_OUTAGE_MODELS, VISION_SAMPLING_BOOST_MODELS
+        )
+    return build_effective_alias_table(
+        _SAMPLING_ITEMS, OUTAGE_MODELS, SAMPLING_BOOST_MODELS
+    )
+
+
+# the alias tables of the current outage and boost models, keyed by `vision`.
+# Built on the first draw rather than at import, and dropped by `set_outage`.
+_ACTIVE_ALIAS: dict[bool, Optional[AliasTable]] = {}
+
+
+def set_outage(models: Iterable[str], vision: bool = False) -> None:
+    '''
+    Replace the outage models, the active alias table is rebuilt once on the next draw,
+    so draws don't filter them.
+    '''
+    global OUTAGE_MODELS, VISION_OUTAGE_MODELS
+    models = frozenset(map(sys.intern, models))
+    if vision:
+        VISION_OUTAGE_MODELS = models
+    else:
+        OUTAGE_MODELS = models
+    _ACTIVE_ALIAS.pop(vision, None)
+
+
+def sample_active(rng: random.Random = random, vision: bool = False) -> Optional[str]:
+    '''
+    Draw a model that is not in outage by its boosted sampling weight, None if all models are out.
+    '''
+    try:
+        table = _ACTIVE_ALIAS[vision]
+    except KeyError:
+        table = _ACTIVE_ALIAS[vision] = get_sampler(vision)
+    if table is None:
+        return None
+    return sample_alias(table, rng)
@@ -4,17 +4,23 @@ Module for analyzing code snippets to determine the environments, dependencies,
 
 
 from enum import StrEnum
-from typing import Any, Generator, TypeAlias, TypedDict, Set
+from typing import Any, Generator, Iterable, TypeAlias, TypedDict, Set
 import gradio as gr
 
 import base64
 
 import ast
-from tree_sitter import Language, Node, Parser
+import functools
+import logging
+from tree_sitter import Language, Node, Parser, Query, QueryCursor
 import tree_sitter_javascript
 import tree_sitter_typescript
 import sys
 import re
+import threading
+
+
+logger = logging.getLogger(__name__)
 
 
 class SandboxEnvironment(StrEnum):
@@ -42,56 +48,277 @@ class SandboxEnvironment(StrEnum):
     GOLANG_RUNNER = 'Golang Runner'
 
 
+TSX_LANGUAGE = Language(tree_sitter_typescript.language_tsx())
+JAVASCRIPT_LANGUAGE = Language(tree_sitter_javascript.language())
+
+# Tree-sitter parsers are not thread-safe, so each thread gets its own
+_thread_parsers = threading.local()
+
+# Each thread also reuses one stack for its tree walks, rather than allocating one per walk
+_thread_walk_stacks = threading.local()
+
+
+def get_tsx_parser() -> Parser:
+    '''
+    Get the TypeScript (TSX) parser of the current thread, created on first use.
+    '''
+    parser = getattr(_thread_parsers, 'tsx', None)
+    if parser is None:
+        parser = _thread_parsers.tsx = Parser(TSX_LANGUAGE)
+    return parser
+
+
+def get_javascript_parser() -> Parser:
+    '''
+    Get the JavaScript parser of the current thread, created on first use.
+    '''
+    parser = getattr(_thread_parsers, 'javascript', None)
+    if parser is None:
+        parser = _thread_parsers.javascript = Parser(JAVASCRIPT_LANGUAGE)
+    return parser
+
+
+def _get_walk_stack(root: Node) -> list[Node]:
+    '''
+    Get the tree walk stack of the current thread, holding only the root of the walk.
+    Walks that stop early clear the stack, so it doesn't keep their tree alive.
+    '''
+    stack = getattr(_thread_walk_stacks, 'stack', None)
+    if stack is None:
+        stack = _thread_walk_stacks.stack = []
+    stack.clear()
+    stack.append(root)
+    return stack
+
+
+STD_LIB_MODULES = frozenset(sys.stdlib_module_names)
+
+
+def _add_import_packages(node: ast.Import, packages: Set[str]) -> None:
+    for name in node.names:
+        # Get the top-level package name from any dotted path
+        # e.g., 'foo.bar.baz' -> 'foo'
+        if name.name:  # Ensure there's a name
+            packages.add(name.name.split('.')[0])
+
+
+def _add_import_from_packages(node: ast.ImportFrom, packages: Set[str]) -> None:
+    # Skip relative imports (those starting with dots)
+    if node.level == 0 and node.module:
+        # Get the top-level package name
+        # e.g., from foo.bar import baz -> 'foo'
+        packages.add(node.module.split('.')[0])
+
+
+def _first_str_arg(node: ast.Call) -> str | None:
+    '''
+    Get the first argument of a call if it is a string literal.
+    '''
+    if node.args:
+        arg = node.args[0]
+        if isinstance(arg, ast.Constant) and isinstance(arg.value, str):
+            return arg.value
+    return None
+
+
+def _add_dynamic_import_packages(node: ast.Call, packages: Set[str]) -> None:
+    # Also check for common dynamic import patterns
+    if isinstance(node.func, ast.Name) and node.func.id == 'importlib':
+        # Handle importlib.import_module('package')
+        module = _first_str_arg(node)
+        if module is not None:
+            packages.add(module.split('.')[0])
+    elif isinstance(node.func, ast.Attribute) and isinstance(node.func.value, ast.Name):
+        # Handle __import__('package') and importlib.import_module('package')
+        if node.func.value.id == 'importlib' and node.func.attr == 'import_module':
+            module = _first_str_arg(node)
+            if module is not None:
+                packages.add(module.split('.')[0])
+        elif node.func.attr == '__import__':
+            module = _first_str_arg(node)
+            if module is not None:
+                packages.add(module.split('.')[0])
+
+
+# nodes that can contain import statements: statements, and the except and match clauses
+# holding statement bodies
+_STATEMENT_NODES = (ast.stmt, ast.excepthandler, ast.match_case)
+
+
+class _ImportVisitor(ast.NodeVisitor):
+    '''
+    Collects the top-level packages imported by a module, and optionally the framework its
+    names mark, see `PYTHON_FRAMEWORK_NAMES`.
+    Imports are statements, so expressions are only walked when looking for dynamic imports or
+    framework names.
+    '''
+
+    def __init__(self, find_dynamic_imports: bool, find_framework: bool = False):
+        self.packages: Set[str] = set()
+        self.find_dynamic_imports = find_dynamic_imports
+        self.find_framework = find_framework
+        self.framework: SandboxEnvironment | None = None
+        # depth of the name the framework was found by, the shallowest one wins as in `ast.walk`
+        self.framework_depth = 0
+        self.depth = 0
+
+    def visit_Import(self, node: ast.Import) -> None:
+        _add_import_packages(node, self.packages)
+
+    def visit_ImportFrom(self, node: ast.ImportFrom) -> None:
+        _add_import_from_packages(node, self.packages)
+
+    def visit_Call(self, node: ast.Call) -> None:
+        if self.find_dynamic_imports:
+            _add_dynamic_import_packages(node, self.packages)
+        self.generic_visit(node)
+
+    def visit_Name(self, node: ast.Name) -> None:
+        if (
+            node.id in PYTHON_FRAMEWORK_NAMES
+            and (self.framework is None or self.depth < self.framework_depth)
+        ):
+            self.framework = PYTHON_FRAMEWORK_NAMES[node.id]
+            self.framework_depth = self.depth
+
+    def generic_visit(self, node: ast.AST) -> None:
+        walk_all = self.find_dynamic_imports or self.find_framework
+        self.depth += 1
+        for child in ast.iter_child_nodes(node):
+            if walk_all or isinstance(child, _STATEMENT_NODES):
+                self.visit(child)
+        self.depth -= 1
+
+
 def extract_python_imports(code: str) -> list[str]:
     '''
     Extract Python package imports using AST parsing.
     Returns a list of top-level package names.
     '''
+    return list(_extract_python_imports(code))
+
+
+# the same message is analyzed again on every re-render, so the results are cached by code.
+# The cached results are tuples, which callers can't mutate.
+@functools.lru_cache(maxsize=256)
+def _extract_python_imports(code: str) -> tuple[str, ...]:
     try:
         tree = ast.parse(code)
     except SyntaxError:
-        return []
+        return ()
 
-    packages: Set[str] = set()
+    # dynamic imports are calls, only walk expressions if the code can have any
+    visitor = _ImportVisitor(find_dynamic_imports='importlib' in code or '__import__' in code)
+    visitor.visit(tree)
+    packages = visitor.packages
 
-    for node in ast.walk(tree):
-        try:
-            if isinstance(node, ast.Import):
-                for name in node.names:
-                    # Get the top-level package name from any dotted path
-                    # e.g., 'foo.bar.baz' -> 'foo'
-                    if name.name:  # Ensure there's a name
-                        packages.add(name.name.split('.')[0])
-
-            elif isinstance(node, ast.ImportFrom):
-                # Skip relative imports (those starting with dots)
-                if node.level == 0 and node.module:
-                    # Get the top-level package name
-                    # e.g., from foo.bar import baz -> 'foo'
-                    packages.add(node.module.split('.')[0])
-
-            # Also check for common dynamic import patterns
-            elif isinstance(node, ast.Call):
-                if isinstance(node.func, ast.Name) and node.func.id == 'importlib':
-                    # Handle importlib.import_module('package')
-                    if len(node.args) > 0 and isinstance(node.args[0], ast.Str):
-                        packages.add(node.args[0].s.split('.')[0])
-                elif isinstance(node.func, ast.Attribute) and isinstance(node.func.value, ast.Name):
-                    # Handle __import__('package') and importlib.import_module('package')
-                    if node.func.value.id == 'importlib' and node.func.attr == 'import_module':
-                        if len(node.args) > 0 and isinstance(node.args[0], ast.Str):
-                            packages.add(node.args[0].s.split('.')[0])
-                    elif node.func.attr == '__import__':
-                        if len(node.args) > 0 and isinstance(node.args[0], ast.Str):
-                            packages.add(node.args[0].s.split('.')[0])
-        except Exception as e:
-            print(f"Error processing node {type(node)}: {e}")
-            continue
+    # Filter out standard library modules
+    return tuple(packages - STD_LIB_MODULES)
+
+
+# script section of a Vue SFC
+SCRIPT_SECTION_PATTERN = re.compile(r'<script.*?>(.*?)</script>', re.DOTALL)
+
+# imports for the regex fallback of `extract_js_imports`: dynamic imports and require calls, or
+# static imports, as one alternation so the code is only scanned once
+JS_IMPORT_PATTERN = re.compile(
+    r'(?:(?:import|require)\s*\(\s*|(?:import|from)\s+)'
+    r'[\'"](?P<package>@?[\w-]+(?:/[\w-]+)*)[\'"]'
+)
+
+
+def _js_package_name(node: Node) -> str | None:
+    '''
+    Extract package name from string literal or template string.
+    '''
+    if node.type in ['string', 'string_fragment']:
+        # Handle regular string literals
+        pkg_path = node.text.decode('utf8').strip('"\'')
+        if not pkg_path.startswith('.'):
+            # Handle scoped packages differently
+            if pkg_path.startswith('@'):
+                parts = pkg_path.split('/')
+                if len(parts) >= 2:
+                    return '/'.join(parts[:2])  # Return @scope/package
+            # Return just the package name for non-scoped packages
+            return pkg_path.split('/')[0]
+    elif node.type == 'template_string':
+        # Handle template literals
+        content = ''
+        has_template_var = False
+        for child in node.children:
+            if child.type == 'string_fragment':
+                content += child.text.decode('utf8')
+            elif child.type == 'template_substitution':
+                has_template_var = True
+                continue
+
+        if not content or content.startswith('.'):
+            return None
+
+        if has_template_var:
+            if content.endswith('-literal'):
+                return 'package-template-literal'
+            return None
+
+        if content.startswith('@'):
+            parts = content.split('/')
+            if len(parts) >= 2:
+                return '/'.join(parts[:2])
+        return content.split('/')[0]
+    return None
+
+
+def _add_js_import_package(node: Node, packages: Set[str]) -> None:
+    '''
+    Add the package a node imports, re-exports or requires, if any.
+    '''
+    if node.type == 'import_statement':
+        # Handle ES6 imports
+        string_node = node.child_by_field_name('source')
+        if string_node:
+            pkg_name = _js_package_name(string_node)
+            if pkg_name:
+                packages.add(pkg_name)
+
+    elif node.type == 'export_statement':
+        # Handle re-exports
+        source = node.child_by_field_name('source')
+        if source:
+            pkg_name = _js_package_name(source)
+            if pkg_name:
+                packages.add(pkg_name)
+
+    elif node.type == 'call_expression':
+        # Handle require calls and dynamic imports
+        func_node = node.child_by_field_name('function')
+        if func_node and func_node.text:
+            func_name = func_node.text.decode('utf8')
+            if func_name in ['require', 'import']:
+                args = node.child_by_field_name('arguments')
+                if args and args.named_children:
+                    arg = args.named_children[0]
+                    pkg_name = _js_package_name(arg)
+                    if pkg_name:
+                        packages.add(pkg_name)
 
-    # Filter out standard library modules using sys.stdlib_module_names
-    std_libs = set(sys.stdlib_module_names)
 
-    return list(packages - std_libs)
+# sources of imports and re-exports, and the first argument of require and import calls, including
+# tagged template calls, matched in one pass by tree-sitter itself; the package names are then
+# extracted by `_js_package_name`
+JS_IMPORT_QUERY_SOURCE = '''
+(import_statement source: (_) @package)
+(export_statement source: (_) @package)
+(call_expression
+  function: (identifier) @function
+  arguments: [(arguments . (_) @package) (template_string . (_) @package)]
+  (#eq? @function "require"))
+(call_expression
+  function: (import)
+  arguments: [(arguments . (_) @package) (template_string . (_) @package)])
+'''
+TSX_IMPORT_QUERY = Query(TSX_LANGUAGE, JS_IMPORT_QUERY_SOURCE)
+JAVASCRIPT_IMPORT_QUERY = Query(JAVASCRIPT_LANGUAGE, JS_IMPORT_QUERY_SOURCE)
 
 
 def extract_js_imports(code: str) -> list[str]:
@@ -100,24 +327,30 @@ def extract_js_imports(code: str) -> list[str]:
     Handles both JavaScript and TypeScript code, including Vue SFC.
     Returns a list of package names.
     '''
+    return list(_extract_js_imports(code))
+
+
+@functools.lru_cache(maxsize=256)
+def _extract_js_imports(code: str) -> tuple[str, ...]:
     try:
         # For Vue SFC, extract the script section first
-        script_match = re.search(r'<script.*?>(.*?)</script>', code, re.DOTALL)
+        script_match = SCRIPT_SECTION_PATTERN.search(code)
         if script_match:
             code = script_match.group(1).strip()
 
-        # Initialize parsers with language modules
-        ts_parser = Parser(Language(tree_sitter_typescript.language_tsx()))
-        js_parser = Parser(Language(tree_sitter_javascript.language()))
+        ts_parser = get_tsx_parser()
+        js_parser = get_javascript_parser()
 
         # Try parsing as TypeScript first, then JavaScript
         code_bytes = bytes(code, "utf8")
         try:
             tree = ts_parser.parse(code_bytes)
+            import_query = TSX_IMPORT_QUERY
         except Exception as e:
             print(f"TypeScript parsing failed: {e}")
             try:
                 tree = js_parser.parse(code_bytes)
+                import_query = JAVASCRIPT_IMPORT_QUERY
             except Exception as e:
                 print(f"JavaScript parsing failed: {e}")
                 tree = None
@@ -127,81 +360,14 @@ def extract_js_imports(code: str) -> list[str]:
 
         packages: Set[str] = set()
 
-        def extract_package_name(node: Node) -> str | None:
-            '''Extract package name from string literal or template string'''
-            if node.type in ['string', 'string_fragment']:
-                # Handle regular string literals
-                pkg_path = code[node.start_byte:node.end_byte].strip('"\'')
-                if not pkg_path.startswith('.'):
-                    # Handle scoped packages differently
-                    if pkg_path.startswith('@'):
-                        parts = pkg_path.split('/')
-                        if len(parts) >= 2:
-                            return '/'.join(parts[:2])  # Return @scope/package
-                    # Return just the package name for non-scoped packages
-                    return pkg_path.split('/')[0]
-            elif node.type == 'template_string':
-                # Handle template literals
-                content = ''
-                has_template_var = False
-                for child in node.children:
-                    if child.type == 'string_fragment':
-                        content += code[child.start_byte:child.end_byte]
-                    elif child.type == 'template_substitution':
-                        has_template_var = True
-                        continue
-
-                if not content or content.startswith('.'):
-                    return None
-
-                if has_template_var:
-                    if content.endswith('-literal'):
-                        return 'package-template-literal'
-                    return None
-
-                if content.startswith('@'):
-                    parts = content.split('/')
-                    if len(parts) >= 2:
-                        return '/'.join(parts[:2])
-                return content.split('/')[0]
-            return None
-
-        def visit_node(node: Node) -> None:
-            if node.type == 'import_statement':
-                # Handle ES6 imports
-                string_node = node.child_by_field_name('source')
-                if string_node:
-                    pkg_name = extract_package_name(string_node)
-                    if pkg_name:
-                        packages.add(pkg_name)
-
-            elif node.type == 'export_statement':
-                # Handle re-exports
-                source = node.child_by_field_name('source')
-                if source:
-                    pkg_name = extract_package_name(source)
-                    if pkg_name:
-                        packages.add(pkg_name)
+        # Let tree-sitter find the import sources instead of walking every node in Python
+        captures = QueryCursor(import_query).captures(tree.root_node)
+        for node in captures.get('package', ()):
+            pkg_name = _js_package_name(node)
+            if pkg_name:
+                packages.add(pkg_name)
 
-            elif node.type == 'call_expression':
-                # Handle require calls and dynamic imports
-                func_node = node.child_by_field_name('function')
-                if func_node and func_node.text:
-                    func_name = func_node.text.decode('utf8')
-                    if func_name in ['require', 'import']:
-                        args = node.child_by_field_name('arguments')
-                        if args and args.named_children:
-                            arg = args.named_children[0]
-                            pkg_name = extract_package_name(arg)
-                            if pkg_name:
-                                packages.add(pkg_name)
-
-            # Recursively visit children
-            for child in node.children:
-                visit_node(child)
-
-        visit_node(tree.root_node)
-        return list(packages)
+        return tuple(packages)
 
     except Exception as e:
         print(f"Tree-sitter parsing failed: {e}")
@@ -209,33 +375,29 @@ def extract_js_imports(code: str) -> list[str]:
         packages: Set[str] = set()
 
         # First try to extract script section for Vue SFC
-        script_match = re.search(r'<script.*?>(.*?)</script>', code, re.DOTALL)
+        script_match = SCRIPT_SECTION_PATTERN.search(code)
         if script_match:
             code = script_match.group(1).strip()
 
         # Look for imports
-        import_patterns = [
-            # dynamic imports
-            r'(?:import|require)\s*\(\s*[\'"](@?[\w-]+(?:/[\w-]+)*)[\'"]',
-            # static imports
-            r'(?:import|from)\s+[\'"](@?[\w-]+(?:/[\w-]+)*)[\'"]',
-            # require statements
-            r'require\s*\(\s*[\'"](@?[\w-]+(?:/[\w-]+)*)[\'"]',
-        ]
-
-        for pattern in import_patterns:
-            matches = re.finditer(pattern, code)
-            for match in matches:
-                pkg_name = match.group(1)
-                if not pkg_name.startswith('.'):
-                    if pkg_name.startswith('@'):
-                        parts = pkg_name.split('/')
-                        if len(parts) >= 2:
-                            packages.add('/'.join(parts[:2]))
-                    else:
-                        packages.add(pkg_name.split('/')[0])
+        for match in JS_IMPORT_PATTERN.finditer(code):
+            pkg_name = match.group('package')
+            if not pkg_name.startswith('.'):
+                if pkg_name.startswith('@'):
+                    parts = pkg_name.split('/')
+                    if len(parts) >= 2:
+                        packages.add('/'.join(parts[:2]))
+                else:
+                    packages.add(pkg_name.split('/')[0])
 
-        return list(packages)
+        return tuple(packages)
+
+
+# conventional aliases of framework modules, which mark code using the framework
+PYTHON_FRAMEWORK_NAMES = {
+    'gr': SandboxEnvironment.GRADIO,
+    'st': SandboxEnvironment.STREAMLIT,
+}
 
 
 def determine_python_environment(code: str, imports: list[str]) -> SandboxEnvironment | None:
@@ -246,13 +408,18 @@ def determine_python_environment(code: str, imports: list[str]) -> SandboxEnviro
         tree = ast.parse(code)
         for node in ast.walk(tree):
             # Check for specific framework usage patterns
-            if isinstance(node, ast.Name) and node.id == 'gr':
-                return SandboxEnvironment.GRADIO
-            elif isinstance(node, ast.Name) and node.id == 'st':
-                return SandboxEnvironment.STREAMLIT
+            if isinstance(node, ast.Name) and node.id in PYTHON_FRAMEWORK_NAMES:
+                return PYTHON_FRAMEWORK_NAMES[node.id]
     except SyntaxError:
         pass
 
+    return _python_environment_from_imports(imports)
+
+
+def _python_environment_from_imports(imports: Iterable[str]) -> SandboxEnvironment:
+    '''
+    Determine Python sandbox environment based on imports only.
+    '''
     # Check imports for framework detection
     if 'pygame' in imports:
         return SandboxEnvironment.PYGAME
@@ -266,99 +433,156 @@ def determine_python_environment(code: str, imports: list[str]) -> SandboxEnviro
     return SandboxEnvironment.PYTHON_RUNNER
 
 
-def determine_jsts_environment(code: str, imports: list[str]) -> SandboxEnvironment | None:
+@functools.lru_cache(maxsize=256)
+def analyze_python(code: str, extra_packages: tuple[str, ...] = ()) -> tuple[tuple[str, ...], SandboxEnvironment]:
     '''
-    Determine JavaScript/TypeScript sandbox environment based on imports and AST analysis.
+    Get the imports and sandbox environment of Python code, as `extract_python_imports` and
+    `determine_python_environment` would, but parsing and walking the code only once.
+
+    Args:
+        code (str): The code to analyze
+        extra_packages (tuple[str, ...]): Packages installed besides the imported ones, e.g. by pip commands
+
+    Returns:
+        tuple[tuple[str, ...], SandboxEnvironment]: The imports and the environment
+    '''
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return (), _python_environment_from_imports(extra_packages)
+
+    # dynamic imports are calls, only check calls if the code can have any
+    visitor = _ImportVisitor(
+        find_dynamic_imports='importlib' in code or '__import__' in code,
+        find_framework=True,
+    )
+    visitor.visit(tree)
+
+    imports = tuple(visitor.packages - STD_LIB_MODULES)
+    return imports, visitor.framework or _python_environment_from_imports(imports + extra_packages)
+
+
+REACT_PACKAGES = frozenset({'react', '@react', 'next', '@next'})
+VUE_PACKAGES = frozenset({'vue', '@vue', 'nuxt', '@nuxt'})
+
+# Vue directives and options in template strings, as bytes to match tree-sitter node text
+VUE_TEMPLATE_STRING_PATTERNS = (
+    b'v-if=', b'v-else', b'v-for=', b'v-bind:', b'v-on:', b'v-model=',
+    b'v-show=', b'v-html=', b'v-text=', b'@', b':',
+    b'components:', b'props:', b'emits:', b'data:',
+    b'methods:', b'computed:', b'watch:',
+    b'setup(', b'ref(', b'reactive(', b'computed(', b'watch(',
+    b'onMounted(', b'onUnmounted(', b'provide(', b'inject(',
+    b'defineComponent(', b'defineProps(', b'defineEmits(',
+    b'createApp(', b'nextTick('
+)
+
+# Vue patterns in script content
+VUE_SCRIPT_PATTERNS = [
+    re.compile(pattern, re.MULTILINE) for pattern in (
+        r'export\s+default\s+{',
+        r'defineComponent\s*\(',
+        r'Vue\.extend\s*\(',
+        r'createApp\s*\(',
+        r'(?:ref|reactive|computed|watch|onMounted|onUnmounted|provide|inject)\s*\(',
+        r'(?:components|props|emits|data|methods|computed|watch)\s*:',
+        r'defineProps\s*\(',
+        r'defineEmits\s*\(',
+        r'v-(?:if|else|for|bind|on|model|show|html|text)=',
+        r'@(?:click|change|input|submit|keyup|keydown)',
+        r':(?:class|style|src|href|value|disabled|checked)'
+    )
+]
+
+
+def _jsts_framework(node: Node) -> SandboxEnvironment | None:
+    '''
+    Get the framework a node is specific to, if any.
+    '''
+    # Check for React patterns
+    if node.type in ['jsx_element', 'jsx_self_closing_element']:
+        return SandboxEnvironment.REACT
+
+    # Check for Vue template
+    elif node.type == 'template_element':
+        return SandboxEnvironment.VUE
+
+    # Check for Vue template string
+    elif node.type == 'template_string':
+        # Look for Vue directives in template strings, on the node's source bytes
+        content = node.text
+        if any(pattern in content for pattern in VUE_TEMPLATE_STRING_PATTERNS):
+            return SandboxEnvironment.VUE
+    return None
+
+
+# Hints of React code, and a capitalized JSX tag that closes, so not a TypeScript generic
+REACT_BYTES_HINTS = (b'jsx', b'React.createElement', b'useState', b'useEffect')
+JSX_COMPONENT_TAG_PATTERN = re.compile(rb'</[A-Z][\w.]*\s*>|<[A-Z][\w.]*(?:\s[^<>]*)?/>')
+
+
+def _jsts_environment_from_imports(code_bytes: bytes, imports: list[str]) -> SandboxEnvironment | None:
+    '''
+    Determine the environment from the Vue SFC structure and the imports, without parsing.
     '''
     # First check for Vue SFC structure
-    if '<template>' in code or '<script setup' in code:
+    if b'<template>' in code_bytes or b'<script setup' in code_bytes:
         return SandboxEnvironment.VUE
 
     # Check imports for framework detection
-    react_packages = {'react', '@react', 'next', '@next'}
-    vue_packages = {'vue', '@vue', 'nuxt', '@nuxt'}
-
-    if any(pkg in react_packages for pkg in imports):
+    if any(pkg in REACT_PACKAGES for pkg in imports):
         return SandboxEnvironment.REACT
-    elif any(pkg in vue_packages for pkg in imports):
+    elif any(pkg in VUE_PACKAGES for pkg in imports):
         return SandboxEnvironment.VUE
+    return None
 
-    try:
-        # Initialize parser
-        ts_parser = Parser(Language(tree_sitter_typescript.language_tsx()))
 
+def _jsts_environment_from_script(code: str) -> SandboxEnvironment:
+    '''
+    Determine the environment from Vue patterns in the script, for code without framework nodes.
+    '''
+    # Additional Vue pattern detection for script content
+    for pattern in VUE_SCRIPT_PATTERNS:
+        if pattern.search(code):
+            return SandboxEnvironment.VUE
+    return SandboxEnvironment.JAVASCRIPT_RUNNER
+
+
+def determine_jsts_environment(code: str, imports: list[str]) -> SandboxEnvironment | None:
+    '''
+    Determine JavaScript/TypeScript sandbox environment based on imports and AST analysis.
+    '''
+    code_bytes = code.encode('utf8')
+    environment = _jsts_environment_from_imports(code_bytes, imports)
+    if environment:
+        return environment
+
+    # JSX and template elements need a '<' and Vue template strings a '`', so without either
+    # there are no framework nodes to parse for
+    if b'<' not in code_bytes and b'`' not in code_bytes:
+        return _jsts_environment_from_script(code)
+
+    # Obvious React code, with no template string that could hold Vue directives
+    if (b'`' not in code_bytes and b'<template' not in code_bytes
+            and any(hint in code_bytes for hint in REACT_BYTES_HINTS)
+            and JSX_COMPONENT_TAG_PATTERN.search(code_bytes)):
+        return SandboxEnvironment.REACT
+
+    try:
         # Parse the code
-        tree = ts_parser.parse(bytes(code, "utf8"))
-
-        def has_framework_patterns(node: Node) -> tuple[bool, str]:
-            # Check for React patterns
-            if node.type in ['jsx_element', 'jsx_self_closing_element']:
-                return True, 'react'
-
-            # Check for Vue template
-            elif node.type == 'template_element':
-                return True, 'vue'
-
-            # Check for Vue template string
-            elif node.type == 'template_string':
-                content = code[node.start_byte:node.end_byte]
-                # Look for Vue directives in template strings
-                vue_patterns = [
-                    'v-if=', 'v-else', 'v-for=', 'v-bind:', 'v-on:', 'v-model=',
-                    'v-show=', 'v-html=', 'v-text=', '@', ':',
-                    'components:', 'props:', 'emits:', 'data:',
-                    'methods:', 'computed:', 'watch:',
-                    'setup(', 'ref(', 'reactive(', 'computed(', 'watch(',
-                    'onMounted(', 'onUnmounted(', 'provide(', 'inject(',
-                    'defineComponent(', 'defineProps(', 'defineEmits(',
-                    'createApp(', 'nextTick('
-                ]
-                if any(pattern in content for pattern in vue_patterns):
-                    return True, 'vue'
-            return False, ''
-
-        # Check for framework-specific patterns in the AST
-        cursor = tree.walk()
-
-        def visit_node() -> SandboxEnvironment | None:
-            is_framework, framework = has_framework_patterns(cursor.node)
-            if is_framework:
-                return SandboxEnvironment.REACT if framework == 'react' else SandboxEnvironment.VUE
-
-            # Check children
-            if cursor.goto_first_child():
-                while True:
-                    result = visit_node()
-                    if result:
-                        return result
-                    if not cursor.goto_next_sibling():
-                        break
-                cursor.goto_parent()
+        tree = get_tsx_parser().parse(code_bytes)
 
-            return None
+        # Check for framework-specific patterns in the AST, in pre-order with an explicit stack
+        stack = _get_walk_stack(tree.root_node)
+        while stack:
+            node = stack.pop()
+            framework = _jsts_framework(node)
+            if framework:
+                stack.clear()
+                return framework
+            stack.extend(reversed(node.children))
 
-        result = visit_node()
-        if result:
-            return result
-
-        # Additional Vue pattern detection for script content
-        vue_patterns = [
-            r'export\s+default\s+{',
-            r'defineComponent\s*\(',
-            r'Vue\.extend\s*\(',
-            r'createApp\s*\(',
-            r'(?:ref|reactive|computed|watch|onMounted|onUnmounted|provide|inject)\s*\(',
-            r'(?:components|props|emits|data|methods|computed|watch)\s*:',
-            r'defineProps\s*\(',
-            r'defineEmits\s*\(',
-            r'v-(?:if|else|for|bind|on|model|show|html|text)=',
-            r'@(?:click|change|input|submit|keyup|keydown)',
-            r':(?:class|style|src|href|value|disabled|checked)'
-        ]
-
-        for pattern in vue_patterns:
-            if re.search(pattern, code, re.MULTILINE):
-                return SandboxEnvironment.VUE
+        return _jsts_environment_from_script(code)
 
     except Exception as e:
         print(f"Tree-sitter parsing error: {e}")
@@ -367,6 +591,57 @@ def determine_jsts_environment(code: str, imports: list[str]) -> SandboxEnvironm
     return SandboxEnvironment.JAVASCRIPT_RUNNER
 
 
+def _is_typescript_node(node: Node) -> bool:
+    # Check for TypeScript-specific syntax
+    if node.type in {
+        'type_annotation',           # Type annotations
+        'type_alias_declaration',    # type Foo = ...
+        'interface_declaration',     # interface Foo
+        'enum_declaration',          # enum Foo
+        'implements_clause',         # implements Interface
+        'type_parameter',            # Generic type parameters
+        'type_assertion',            # Type assertions
+        'type_predicate',           # Type predicates in functions
+        'type_arguments',           # Generic type arguments
+        'readonly_type',            # readonly keyword
+        'mapped_type',              # Mapped types
+        'conditional_type',         # Conditional types
+        'union_type',               # Union types
+        'intersection_type',        # Intersection types
+        'tuple_type',              # Tuple types
+        'optional_parameter',       # Optional parameters
+        'decorator',                # Decorators
+        'ambient_declaration',      # Ambient declarations
+        'declare_statement',        # declare keyword
+        'accessibility_modifier',   # private/protected/public
+    }:
+        return True
+
+    # Check for type annotations in variable declarations
+    if node.type == 'variable_declarator':
+        for child in node.children:
+            if child.type == 'type_annotation':
+                return True
+
+    # Check for return type annotations in functions
+    if node.type in {'function_declaration', 'method_definition', 'arrow_function'}:
+        for child in node.children:
+            if child.type == 'type_annotation':
+                return True
+
+    return False
+
+
+# Tokens that any of the TypeScript syntax looked for by `detect_js_ts_code_lang` needs: type
+# annotations and predicates need ':', generics '<', decorators '@', optional parameters '?',
+# and the rest their keyword. Code without any of them can't be TypeScript.
+TS_SYNTAX_TOKENS_PATTERN = re.compile(
+    rb'[:<@?]|\b(?:interface|type|enum|implements|readonly|declare|abstract'
+    rb'|public|private|protected|namespace|as|satisfies)\b'
+)
+
+
+@functools.lru_cache(maxsize=256)
 def detect_js_ts_code_lang(code: str) -> str:
     '''
     Detect whether code is JavaScript or TypeScript using Tree-sitter AST parsing.
@@ -378,84 +653,93 @@ def detect_js_ts_code_lang(code: str) -> str:
     Returns:
         str: 'typescript' if TypeScript patterns are found, 'javascript' otherwise
     '''
+    code_bytes = code.encode('utf8')
+
     # Quick check for explicit TypeScript in Vue SFC
-    if '<script lang="ts">' in code or '<script lang="typescript">' in code:
+    if b'<script lang="ts">' in code_bytes or b'<script lang="typescript">' in code_bytes:
         return 'typescript'
 
-    try:
-        # Initialize TypeScript parser
-        ts_parser = Parser(Language(tree_sitter_typescript.language_tsx()))
+    # Skip parsing code that has none of the TypeScript syntax
+    if not TS_SYNTAX_TOKENS_PATTERN.search(code_bytes):
+        return 'javascript'
 
+    try:
         # Parse the code
-        tree = ts_parser.parse(bytes(code, "utf8"))
-
-        def has_typescript_patterns(node: Node) -> bool:
-            # Check for TypeScript-specific syntax
-            if node.type in {
-                'type_annotation',           # Type annotations
-                'type_alias_declaration',    # type Foo = ...
-                'interface_declaration',     # interface Foo
-                'enum_declaration',          # enum Foo
-                'implements_clause',         # implements Interface
-                'type_parameter',            # Generic type parameters
-                'type_assertion',            # Type assertions
-                'type_predicate',           # Type predicates in functions
-                'type_arguments',           # Generic type arguments
-                'readonly_type',            # readonly keyword
-                'mapped_type',              # Mapped types
-                'conditional_type',         # Conditional types
-                'union_type',               # Union types
-                'intersection_type',        # Intersection types
-                'tuple_type',              # Tuple types
-                'optional_parameter',       # Optional parameters
-                'decorator',                # Decorators
-                'ambient_declaration',      # Ambient declarations
-                'declare_statement',        # declare keyword
-                'accessibility_modifier',   # private/protected/public
-            }:
-                return True
-
-            # Check for type annotations in variable declarations
-            if node.type == 'variable_declarator':
-                for child in node.children:
-                    if child.type == 'type_annotation':
-                        return True
+        tree = get_tsx_parser().parse(code_bytes)
 
-            # Check for return type annotations in functions
-            if node.type in {'function_declaration', 'method_definition', 'arrow_function'}:
-                for child in node.children:
-                    if child.type == 'type_annotation':
-                        return True
+        # Walk the AST to find TypeScript patterns, with an explicit stack
+        stack = _get_walk_stack(tree.root_node)
+        while stack:
+            node = stack.pop()
+            if _is_typescript_node(node):
+                stack.clear()
+                return 'typescript'
+            stack.extend(node.children)
 
-            return False
-
-        # Walk the AST to find TypeScript patterns
-        cursor = tree.walk()
+    except Exception as e:
+        print(f"Tree-sitter parsing error: {e}")
+        # Fallback to basic checks if parsing fails
+        pass
 
-        def visit_node() -> bool:
-            if has_typescript_patterns(cursor.node):
-                return True
+    return 'javascript'
 
-            # Check children
-            if cursor.goto_first_child():
-                while True:
-                    if visit_node():
-                        return True
-                    if not cursor.goto_next_sibling():
-                        break
-                cursor.goto_parent()
 
-            return False
+@functools.lru_cache(maxsize=256)
+def analyze_jsts(code: str) -> tuple[tuple[str, ...], SandboxEnvironment | None, str]:
+    '''
+    Get the npm imports, sandbox environment and language of JavaScript/TypeScript code, as
+    `extract_js_imports`, `determine_jsts_environment` and `detect_js_ts_code_lang` would,
+    but parsing and walking the code only once.
 
-        if visit_node():
-            return 'typescript'
+    Returns:
+        tuple[tuple[str, ...], SandboxEnvironment | None, str]: The imports, the environment,
+        and 'typescript' or 'javascript'.
+    '''
+    # The imports of a Vue SFC come from its script section only, which is parsed on its own
+    if SCRIPT_SECTION_PATTERN.search(code):
+        imports = _extract_js_imports(code)
+        return imports, determine_jsts_environment(code, imports), detect_js_ts_code_lang(code)
 
+    code_bytes = code.encode('utf8')
+    try:
+        tree = get_tsx_parser().parse(code_bytes)
     except Exception as e:
         print(f"Tree-sitter parsing error: {e}")
-        # Fallback to basic checks if parsing fails
-        pass
+        imports = _extract_js_imports(code)
+        return imports, determine_jsts_environment(code, imports), detect_js_ts_code_lang(code)
 
-    return 'javascript'
+    packages: Set[str] = set()
+    framework = None
+    is_typescript = False
+    # one pre-order walk collecting the imports, the first framework node and any TypeScript node
+    stack = _get_walk_stack(tree.root_node)
+    while stack:
+        node = stack.pop()
+        _add_js_import_package(node, packages)
+        if framework is None:
+            framework = _jsts_framework(node)
+        if not is_typescript:
+            is_typescript = _is_typescript_node(node)
+        stack.extend(reversed(node.children))
+
+    imports = tuple(packages)
+    environment = (
+        _jsts_environment_from_imports(code_bytes, imports)
+        or framework
+        or _jsts_environment_from_script(code)
+    )
+    if b'<script lang="ts">' in code_bytes or b'<script lang="typescript">' in code_bytes:
+        is_typescript = True
+    return imports, environment, 'typescript' if is_typescript else 'javascript'
+
+
+# pip install commands in comments and Jupyter-style !pip install commands, with optional
+# flags and requirements files, as one alternation so each line is only scanned once
+PIP_INSTALL_PATTERN = re.compile(
+    r'(?:#|!)\s*(?:pip|pip3|python -m pip)\s+install\s+'
+    r'(?:(?:--upgrade|--user|--no-cache-dir|-U)\s+|-r\s+[\w\-\.\/]+\s+)*'
+    r'(?P<packages>[^-\s][\w\-\[\]<>=~\.]+(?:\s+[^-\s][\w\-\[\]<>=~\.]+)*)'
+)
 
 
 def extract_inline_pip_install_commands(code: str) -> tuple[list[str], str]:
@@ -472,46 +756,59 @@ def extract_inline_pip_install_commands(code: str) -> tuple[list[str], str]:
             1. List of Python packages extracted from pip install commands in comments
             2. Code with the pip install comments removed
     '''
-    python_packages = []
+    python_packages: dict[str, None] = {}  # insertion-ordered, so duplicates are dropped in order
     cleaned_lines = []
 
-    # Regex patterns to match pip install commands in comments and Jupyter-style commands
-    pip_patterns = [
-        # Comments with pip install
-        r'#\s*(?:pip|pip3|python -m pip)\s+install\s+(?:(?:--upgrade|--user|--no-cache-dir|-U)\s+)*([^-\s][\w\-\[\]<>=~\.]+(?:\s+[^-\s][\w\-\[\]<>=~\.]+)*)',
-        # Jupyter-style !pip install
-        r'!\s*(?:pip|pip3|python -m pip)\s+install\s+(?:(?:--upgrade|--user|--no-cache-dir|-U)\s+)*([^-\s][\w\-\[\]<>=~\.]+(?:\s+[^-\s][\w\-\[\]<>=~\.]+)*)',
-        # Requirements file style pip install
-        r'(?:#|!)\s*(?:pip|pip3|python -m pip)\s+install\s+(?:-r\s+[\w\-\.\/]+\s+)*([^-\s][\w\-\[\]<>=~\.]+(?:\s+[^-\s][\w\-\[\]<>=~\.]+)*)'
-    ]
-
     # Process each line
     for line in code.splitlines():
-        matched = False
-        for pattern in pip_patterns:
-            match = re.search(pattern, line)
-            if match:
-                matched = True
-                # Extract packages from the command
-                pkgs = match.group(1).strip().split()
-                # Clean package names (remove version specifiers)
-                cleaned_pkgs = [pkg.split('==')[0].split('>=')[0].split('<=')[
-                    0].split('~=')[0] for pkg in pkgs]
-                python_packages.extend(cleaned_pkgs)
-
-                # Remove the pip install command from the line
-                cleaned_line = line[:match.start()].rstrip()
-                if cleaned_line:  # Only add non-empty lines
-                    cleaned_lines.append(cleaned_line)
-                break
-
-        if not matched:
+        # Every command has 'pip' and 'install' in it, most lines don't
+        if 'install' not in line or 'pip' not in line:
             cleaned_lines.append(line)
+            continue
 
-    # Remove duplicates while preserving order
-    python_packages = list(dict.fromkeys(python_packages))
+        match = PIP_INSTALL_PATTERN.search(line)
+        if match:
+            # Extract packages from the command
+            pkgs = match.group('packages').strip().split()
+            # Clean package names (remove version specifiers)
+            cleaned_pkgs = [pkg.split('==')[0].split('>=')[0].split('<=')[
+                0].split('~=')[0] for pkg in pkgs]
+            for pkg in cleaned_pkgs:
+                python_packages.setdefault(pkg, None)
+
+            # Remove the pip install command from the line
+            cleaned_line = line[:match.start()].rstrip()
+            if cleaned_line:  # Only add non-empty lines
+                cleaned_lines.append(cleaned_line)
+        else:
+            cleaned_lines.append(line)
+
+    return list(python_packages), '\n'.join(cleaned_lines)
+
+
+# CDN script tags
+# The HTML patterns are bytes patterns, matched on the encoded code, which is scanned once per
+# pattern and only decoded for the package names and scripts they find
+CDN_SCRIPT_PATTERNS = [
+    re.compile(pattern, re.IGNORECASE) for pattern in (
+        # unpkg.com pattern
+        rb'<script[^>]*src="https?://unpkg\.com/(@?[^@/"]+(?:/[^@/"]+)?(?:@[^/"]+)?)[^"]*"[^>]*>',
+        # cdn.jsdelivr.net pattern - explicitly handle /npm/ in the path
+        rb'<script[^>]*src="https?://cdn\.jsdelivr\.net/npm/(@?[^@/"]+(?:/[^@/"]+)?(?:@[^/"]+)?)[^"]*"[^>]*>',
+        # Generic CDN pattern for any domain - exclude common path components
+        rb'<script[^>]*src="https?://(?!(?:[^"]+/)?(?:npm|dist|lib|build|umd|esm|cjs|min)/)[^"]+?/(@?[\w-]+)(?:/[^"]*)?[^"]*"[^>]*>',
+    )
+]
+
+INLINE_SCRIPT_PATTERN = re.compile(rb'<script[^>]*>(.*?)</script>', re.DOTALL | re.IGNORECASE)
 
-    return python_packages, '\n'.join(cleaned_lines)
+# ES module imports with full URLs
+ES_MODULE_CDN_IMPORT_PATTERNS = [
+    # Match imports from CDN URLs, being careful to extract only the package name
+    re.compile(rb'import\s+[\w\s{},*]+\s+from\s+[\'"]https?://[^/]+/npm/([^/@"\s]+)[@/][^"]*[\'"]'),
+]
+
+URL_IMPORT_PATTERN = re.compile(rb'import\s+[\w\s{},*]+\s+from\s+[\'"]https?://[^"]+[\'"]')
 
 
 def extract_js_from_html_script_tags(code: str) -> list[str]:
@@ -526,22 +823,14 @@ def extract_js_from_html_script_tags(code: str) -> list[str]:
         list[str]: List of package names
     '''
     packages: Set[str] = set()
+    code_bytes = code.encode('utf8')
 
     # Extract packages from CDN script tags
-    script_patterns = [
-        # unpkg.com pattern
-        r'<script[^>]*src="https?://unpkg\.com/(@?[^@/"]+(?:/[^@/"]+)?(?:@[^/"]+)?)[^"]*"[^>]*>',
-        # cdn.jsdelivr.net pattern - explicitly handle /npm/ in the path
-        r'<script[^>]*src="https?://cdn\.jsdelivr\.net/npm/(@?[^@/"]+(?:/[^@/"]+)?(?:@[^/"]+)?)[^"]*"[^>]*>',
-        # Generic CDN pattern for any domain - exclude common path components
-        r'<script[^>]*src="https?://(?!(?:[^"]+/)?(?:npm|dist|lib|build|umd|esm|cjs|min)/)[^"]+?/(@?[\w-]+)(?:/[^"]*)?[^"]*"[^>]*>',
-    ]
-
     seen_packages = set()  # Track packages we've already added to avoid duplicates
-    for pattern in script_patterns:
-        matches = re.finditer(pattern, code, re.IGNORECASE)
+    for pattern in CDN_SCRIPT_PATTERNS:
+        matches = pattern.finditer(code_bytes)
         for match in matches:
-            pkg_name = match.group(1)
+            pkg_name = match.group(1).decode('utf8')
             if pkg_name.startswith('@'):
                 # Handle scoped packages
                 parts = pkg_name.split('/')
@@ -556,21 +845,17 @@ def extract_js_from_html_script_tags(code: str) -> list[str]:
                 seen_packages.add(pkg_name)
                 packages.add(pkg_name)
 
-    # Extract packages from inline scripts
-    script_tags = re.finditer(
-        r'<script[^>]*>(.*?)</script>', code, re.DOTALL | re.IGNORECASE)
+    # Extract packages from inline scripts, collecting the scripts without CDN imports to parse together
+    script_bodies = []
+    script_tags = INLINE_SCRIPT_PATTERN.finditer(code_bytes)
     for script in script_tags:
         script_content = script.group(1)
         # Check for ES module imports with full URLs
-        es_module_patterns = [
-            # Match imports from CDN URLs, being careful to extract only the package name
-            r'import\s+[\w\s{},*]+\s+from\s+[\'"]https?://[^/]+/npm/([^/@"\s]+)[@/][^"]*[\'"]',
-        ]
         found_cdn_import = False
-        for pattern in es_module_patterns:
-            matches = re.finditer(pattern, script_content)
+        for pattern in ES_MODULE_CDN_IMPORT_PATTERNS:
+            matches = pattern.finditer(script_content)
             for match in matches:
-                pkg_name = match.group(1)
+                pkg_name = match.group(1).decode('utf8')
                 if pkg_name and pkg_name not in seen_packages and not pkg_name.lower() in {'npm', 'dist', 'lib', 'build', 'umd', 'esm', 'cjs', 'min', 'https', 'http'}:
                     seen_packages.add(pkg_name)
                     packages.add(pkg_name)
@@ -578,14 +863,81 @@ def extract_js_from_html_script_tags(code: str) -> list[str]:
 
         # Only check for regular imports if we didn't find a CDN import
         if not found_cdn_import:
-            # Remove any URL imports before passing to extract_js_imports
-            cleaned_content = re.sub(
-                r'import\s+[\w\s{},*]+\s+from\s+[\'"]https?://[^"]+[\'"]', '', script_content)
-            packages.update(extract_js_imports(cleaned_content))
+            script_bodies.append(script_content)
+
+    if script_bodies:
+        # Remove any URL imports, then parse all the scripts at once, as separate statements
+        cleaned_content = URL_IMPORT_PATTERN.sub(b'', b'\n;\n'.join(script_bodies))
+        packages.update(extract_js_imports(cleaned_content.decode('utf8')))
 
     return list(packages)
 
 
+# code block languages that are only picked as the main code if there is nothing else
+LOW_PRIORITY_LANGUAGES = frozenset({'bash', 'shell', 'sh', 'zsh', 'powershell', 'pwsh', ''})
+
+# code block language prefixes for each environment, as tuples for str.startswith
+PYTHON_PREFIXES = ('py', 'ipython', 'pygame', 'gradio', 'streamlit')
+VUE_PREFIXES = ('vue',)
+REACT_PREFIXES = ('react', 'next')
+JS_PREFIXES = ('js', 'javascript', 'jsx', 'coffee', 'ecma', 'node', 'es')
+HTML_PREFIXES = ('html', 'xhtml', 'htm')
+TS_PREFIXES = ('ts', 'typescript', 'tsx')
+MERMAID_PREFIXES = ('mermaid', 'mmd')
+CPP_PREFIXES = ('cpp', 'c++')
+GO_PREFIXES = ('go', 'golang')
+JAVA_PREFIXES = ('java',)
+RUST_PREFIXES = ('rust',)
+
+# language families by their prefixes, in the order they are matched
+LANGUAGE_FAMILY_PREFIXES = (
+    ('python', PYTHON_PREFIXES),
+    ('vue', VUE_PREFIXES),
+    ('react', REACT_PREFIXES),
+    ('javascript', JS_PREFIXES),
+    ('typescript', TS_PREFIXES),
+    ('html', HTML_PREFIXES),
+    ('mermaid', MERMAID_PREFIXES),
+    ('cpp', CPP_PREFIXES),
+    ('go', GO_PREFIXES),
+    ('java', JAVA_PREFIXES),
+    ('rust', RUST_PREFIXES),
+)
+
+
+def _match_language_family(code_lang: str) -> str | None:
+    '''
+    Get the language family of a code block language by matching its prefix.
+    '''
+    for family, prefixes in LANGUAGE_FAMILY_PREFIXES:
+        if code_lang.startswith(prefixes):
+            return family
+    if code_lang == 'c':
+        return 'c'
+    return None
+
+
+# language families of the common code block languages, so most blocks need no prefix matching
+LANGUAGE_FAMILIES = {
+    code_lang: _match_language_family(code_lang)
+    for code_lang in (
+        *(prefix for _, prefixes in LANGUAGE_FAMILY_PREFIXES for prefix in prefixes),
+        'python', 'python3', 'py3', 'c', 'vue3', 'reactjs', 'nextjs', 'node.js', 'golang',
+    )
+}
+
+
+def get_language_family(code_lang: str) -> str | None:
+    '''
+    Get the language family of a code block language, e.g. 'python' for 'py' or 'python3'.
+    '''
+    if code_lang in LANGUAGE_FAMILIES:
+        return LANGUAGE_FAMILIES[code_lang]
+    return _match_language_family(code_lang)
+
+CODE_BLOCK_PATTERN = re.compile(r'```(?P<code_lang>[\w\+\#\-\.]*)?[ \t]*\r?\n?(?P<code>.*?)```', re.DOTALL)
+
+
 def extract_code_from_markdown(message: str, enable_auto_env: bool = False) -> tuple[str, str, tuple[list[str], list[str]], SandboxEnvironment | None] | None:
     '''
     Extracts code from a markdown message by parsing code blocks directly.
@@ -598,105 +950,88 @@ def extract_code_from_markdown(message: str, enable_auto_env: bool = False) -> t
             3. sandbox python and npm dependencies (extracted using static analysis)
             4. sandbox environment determined from code content
     '''
-    code_block_regex = r'```(?P<code_lang>[\w\+\#\-\.]*)?[ \t]*\r?\n?(?P<code>.*?)```'
-    matches = list(re.finditer(code_block_regex, message, re.DOTALL))
-
-    if not matches:
-        return None
-
-    # Define a low-priority list for certain languages
-    low_priority_languages = ['bash', 'shell',
-                              'sh', 'zsh', 'powershell', 'pwsh', '']
-
-    # Find the main code block by avoiding low-priority languages
+    # Find the main code block by avoiding low-priority languages, and the longest code block
+    # as a fallback, in one pass over the code blocks
+    codes: list[str] = []
     main_code = None
     main_code_lang = None
     max_length = 0
+    longest_code = None
+    longest_code_lang = None
+    longest_length = -1
 
-    for match in matches:
-        code = match.group('code').strip()
+    for match in CODE_BLOCK_PATTERN.finditer(message):
+        raw_code = match.group('code')
+        code = raw_code.strip()
         code_lang = (match.group('code_lang') or '').lower()
-        if code_lang not in low_priority_languages and len(code) > max_length:
+        codes.append(code)
+        if code_lang not in LOW_PRIORITY_LANGUAGES and len(code) > max_length:
             main_code = code
             main_code_lang = code_lang
             max_length = len(code)
+        if len(raw_code) > longest_length:
+            longest_code = code
+            longest_code_lang = code_lang
+            longest_length = len(raw_code)
+
+    if not codes:
+        return None
 
     # Fallback to the longest code block if no main code was found
     if not main_code:
-        longest_match = max(matches, key=lambda m: len(m.group('code')))
-        main_code = longest_match.group('code').strip()
-        main_code_lang = (longest_match.group('code_lang') or '').lower()
-
-    # Define language prefixes for each environment
-    python_prefixes = ['py', 'ipython', 'pygame', 'gradio', 'streamlit']
-    vue_prefixes = ['vue']
-    react_prefixes = ['react', 'next']
-    js_prefixes = ['js', 'javascript', 'jsx', 'coffee', 'ecma', 'node', 'es']
-    html_prefixes = ['html', 'xhtml', 'htm']
-    ts_prefixes = ['ts', 'typescript', 'tsx']
-    mermaid_prefixes = ['mermaid', 'mmd']
-    c_prefixes = ['c']
-    cpp_prefixes = ['cpp', 'c++']
-    go_prefixes = ['go', 'golang']
-    java_prefixes = ['java']
-    rust_prefixes = ['rust']
-    csharp_prefixes = ['cs', 'csharp', 'dotnet']
+        main_code = longest_code
+        main_code_lang = longest_code_lang
 
     # Extract package dependencies from the main program
     python_packages: list[str] = []
     npm_packages: list[str] = []
 
-    # Helper function to check if any prefix matches
-    def matches_prefix(lang: str, prefixes: list[str]) -> bool:
-        return any(lang.lower().startswith(prefix) for prefix in prefixes)
-
-    if matches_prefix(main_code_lang, python_prefixes):
-        python_packages = extract_python_imports(main_code)
+    language_family = get_language_family(main_code_lang)
+    if language_family == 'python':
         extra_python_packages, main_code = extract_inline_pip_install_commands(
             main_code)
-        python_packages.extend(extra_python_packages)
-        sandbox_env_name = determine_python_environment(
-            main_code, python_packages)
-    elif matches_prefix(main_code_lang, vue_prefixes):
-        npm_packages = extract_js_imports(main_code)
+        python_packages, sandbox_env_name = analyze_python(
+            main_code, tuple(extra_python_packages))
+        python_packages = list(python_packages) + extra_python_packages
+    elif language_family == 'vue':
+        npm_packages, _, main_code_lang = analyze_jsts(main_code)
+        npm_packages = list(npm_packages)
         sandbox_env_name = SandboxEnvironment.VUE
-        main_code_lang = detect_js_ts_code_lang(main_code)
-    elif matches_prefix(main_code_lang, react_prefixes):
-        npm_packages = extract_js_imports(main_code)
+    elif language_family == 'react':
+        npm_packages, _, main_code_lang = analyze_jsts(main_code)
+        npm_packages = list(npm_packages)
         sandbox_env_name = SandboxEnvironment.REACT
-        main_code_lang = detect_js_ts_code_lang(main_code)
-    elif ('<!DOCTYPE html>' in main_code and ('<head' in main_code or '<body' in main_code)) or (main_code.strip().startswith('<svg')) or (not matches_prefix(main_code_lang, [*react_prefixes, *vue_prefixes, *js_prefixes, *ts_prefixes]) and ('<html' in main_code or '<!DOCTYPE html>' in main_code)):
+    elif ('<!DOCTYPE html>' in main_code and ('<head' in main_code or '<body' in main_code)) or (main_code.strip().startswith('<svg')) or (language_family not in ('javascript', 'typescript') and ('<html' in main_code or '<!DOCTYPE html>' in main_code)):
         npm_packages = extract_js_from_html_script_tags(main_code)
         sandbox_env_name = SandboxEnvironment.HTML
         main_code_lang = 'html'
-    elif matches_prefix(main_code_lang, js_prefixes):
+    elif language_family == 'javascript':
         main_code_lang = 'javascript'
-        npm_packages = extract_js_imports(main_code)
-        sandbox_env_name = determine_jsts_environment(main_code, npm_packages)
-    elif matches_prefix(main_code_lang, ts_prefixes):
+        npm_packages, sandbox_env_name, _ = analyze_jsts(main_code)
+        npm_packages = list(npm_packages)
+    elif language_family == 'typescript':
         main_code_lang = 'typescript'
-        npm_packages = extract_js_imports(main_code)
-        sandbox_env_name = determine_jsts_environment(main_code, npm_packages)
-    elif matches_prefix(main_code_lang, html_prefixes):
-        main_code_lang = detect_js_ts_code_lang(main_code)
-        npm_packages = extract_js_imports(main_code)
-        sandbox_env_name = determine_jsts_environment(main_code, npm_packages)
-    elif matches_prefix(main_code_lang, mermaid_prefixes):
+        npm_packages, sandbox_env_name, _ = analyze_jsts(main_code)
+        npm_packages = list(npm_packages)
+    elif language_family == 'html':
+        npm_packages, sandbox_env_name, main_code_lang = analyze_jsts(main_code)
+        npm_packages = list(npm_packages)
+    elif language_family == 'mermaid':
         main_code_lang = 'markdown'
         sandbox_env_name = SandboxEnvironment.MERMAID
-    elif matches_prefix(main_code_lang, cpp_prefixes):
+    elif language_family == 'cpp':
         main_code_lang = 'cpp'
         sandbox_env_name = SandboxEnvironment.CPP_RUNNER
-    elif matches_prefix(main_code_lang, go_prefixes):
+    elif language_family == 'go':
         main_code_lang = 'go'
         sandbox_env_name = SandboxEnvironment.GOLANG_RUNNER
-    elif matches_prefix(main_code_lang, java_prefixes):
+    elif language_family == 'java':
         main_code_lang = 'java'
         sandbox_env_name = SandboxEnvironment.JAVA_RUNNER
-    elif matches_prefix(main_code_lang, rust_prefixes):
+    elif language_family == 'rust':
         main_code_lang = 'rust'
         sandbox_env_name = SandboxEnvironment.RUST_RUNNER
-    elif main_code_lang == 'c':
+    elif language_family == 'c':
         main_code_lang = 'c'
         sandbox_env_name = sandbox_env_name = SandboxEnvironment.C_RUNNER
     else:
@@ -705,8 +1040,7 @@ def extract_code_from_markdown(message: str, enable_auto_env: bool = False) -> t
     all_python_packages: Set[str] = set(python_packages)
     all_npm_packages: Set[str] = set(npm_packages)
 
-    for match in matches:
-        code = match.group('code').strip()
+    for code in codes:
         if code != main_code:
             install_python_packages, install_npm_packages = extract_installation_commands(
                 code)
@@ -719,20 +1053,10 @@ def extract_code_from_markdown(message: str, enable_auto_env: bool = False) -> t
     return main_code, main_code_lang, (list(all_python_packages), list(all_npm_packages)), sandbox_env_name
 
 
-def create_placeholder_svg_data_url(width: int, height: int) -> str:
-    '''
-    Create a data URL for a placeholder image with given dimensions.
-    Uses SVG to create an elegant placeholder.
-
-    Args:
-        width: Width of the placeholder image
-        height: Height of the placeholder image
-
-    Returns:
-        str: Data URL containing the SVG image
-    '''
-    # Create SVG with gradient background and text
-    svg = f'''<svg width="{width}" height="{height}" xmlns="http://www.w3.org/2000/svg">
+# constant parts of the placeholder SVG, between its width, height and font sizes
+_SVG_HEAD = '<svg width="'
+_SVG_WIDTH_TAIL = '" height="'
+_SVG_HEIGHT_TAIL = '''" xmlns="http://www.w3.org/2000/svg">
         <defs>
             <linearGradient id="bg" x1="0%" y1="0%" x2="100%" y2="100%">
                 <stop offset="0%" style="stop-color:#F3F4F6"/>
@@ -744,21 +1068,55 @@ def create_placeholder_svg_data_url(width: int, height: int) -> str:
             x="50%"
             y="50%"
             font-family="system-ui, -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif"
-            font-size="{min(width, height) // 14}"
+            font-size="'''
+_SVG_FONT_SIZE_TAIL = '''"
             fill="#94A3B8"
             font-weight="300"
             letter-spacing="0.05em"
             text-anchor="middle"
             dominant-baseline="middle">
-            <tspan x="50%" dy="-1em">{width}</tspan>
-            <tspan x="50%" dy="1.4em" font-size="{min(width, height) // 16}">×</tspan>
-            <tspan x="50%" dy="1.4em">{height}</tspan>
+            <tspan x="50%" dy="-1em">'''
+_SVG_WIDTH_TEXT_TAIL = '''</tspan>
+            <tspan x="50%" dy="1.4em" font-size="'''
+_SVG_TIMES_FONT_SIZE_TAIL = '''">×</tspan>
+            <tspan x="50%" dy="1.4em">'''
+_SVG_TAIL = '''</tspan>
         </text>
     </svg>'''
 
+
+# the same sizes come up again and again, so the encoded SVGs are cached
+@functools.lru_cache(maxsize=256)
+def create_placeholder_svg_data_url(width: int, height: int) -> str:
+    '''
+    Create a data URL for a placeholder image with given dimensions.
+    Uses SVG to create an elegant placeholder.
+
+    Args:
+        width: Width of the placeholder image
+        height: Height of the placeholder image
+
+    Returns:
+        str: Data URL containing the SVG image
+    '''
+    # Create SVG with gradient background and text, joining the constant parts with the sizes
+    size = min(width, height)
+    font_size = str(size // 14)
+    times_font_size = str(size // 16)
+    width_str = str(width)
+    height_str = str(height)
+    svg = ''.join((
+        _SVG_HEAD, width_str, _SVG_WIDTH_TAIL, height_str, _SVG_HEIGHT_TAIL, font_size,
+        _SVG_FONT_SIZE_TAIL, width_str, _SVG_WIDTH_TEXT_TAIL, times_font_size,
+        _SVG_TIMES_FONT_SIZE_TAIL, height_str, _SVG_TAIL,
+    ))
+
     # Convert to base64 data URL
-    encoded_svg = base64.b64encode(svg.encode()).decode()
-    return f'data:image/svg+xml;base64,{encoded_svg}'
+    encoded_svg = base64.b64encode(svg.encode()).decode('ascii')
+    return 'data:image/svg+xml;base64,' + encoded_svg
+
+
+PLACEHOLDER_URL_PATTERN = re.compile(r'/api/placeholder/(\d+)/(\d+)')
 
 
 def replace_placeholder_urls(code: str) -> str:
@@ -772,20 +1130,63 @@ def replace_placeholder_urls(code: str) -> str:
     Returns:
         str: Code with placeholder URLs replaced with data URLs
     '''
-
-    def replacer(match: re.Match) -> str:
+    # Replace all occurrences, joining the code between matches with the data URLs
+    parts = []
+    last_end = 0
+    for match in PLACEHOLDER_URL_PATTERN.finditer(code):
         # Extract width and height from the URL using capturing groups
         width = int(match.group(1))
         height = int(match.group(2))
-        print(f'Replacing placeholder URL with SVG: {width}x{height}')
-        data_url = create_placeholder_svg_data_url(width, height)
-        return data_url
+        logger.debug('Replacing placeholder URL with SVG: %dx%d', width, height)
+        parts.append(code[last_end:match.start()])
+        parts.append(create_placeholder_svg_data_url(width, height))
+        last_end = match.end()
+
+    if not parts:
+        return code
+    parts.append(code[last_end:])
+    return ''.join(parts)
 
-    # Regular expression pattern to match placeholder URLs
-    pattern = r'/api/placeholder/(\d+)/(\d+)'
 
-    # Replace all occurrences
-    return re.sub(pattern, replacer, code)
+# pip install and npm/yarn install commands, as one pattern each so each line is scanned once.
+# 'pip install' also covers 'python -m pip install', and 'npm i' covers 'npm install'
+PIP_INSTALL_COMMAND_PATTERN = re.compile(r'pip3? install')
+NPM_INSTALL_COMMAND_PATTERN = re.compile(r'npm i|yarn add')
+
+# flags before the packages of an install command, each followed by whitespace or the end
+LEADING_FLAGS_PATTERN = re.compile(r'(?:-\S*(?:\s+|$))*')
+
+
+def _split_install_arguments(parts: str) -> list[str]:
+    '''
+    Split install command arguments by whitespace, respecting quotes and dropping the quote characters.
+    '''
+    # Most commands have no quotes, which is a plain whitespace split
+    if '"' not in parts and "'" not in parts:
+        return parts.split()
+
+    current = ''
+    in_quotes = False
+    quote_char = None
+    packages = []
+
+    for char in parts:
+        if char in '"\'':
+            if not in_quotes:
+                in_quotes = True
+                quote_char = char
+            elif char == quote_char:
+                in_quotes = False
+                quote_char = None
+        elif char.isspace() and not in_quotes:
+            if current:
+                packages.append(current)
+                current = ''
+        else:
+            current += char
+    if current:
+        packages.append(current)
+    return packages
 
 
 def extract_installation_commands(code: str) -> tuple[list[str], list[str]]:
@@ -800,57 +1201,43 @@ def extract_installation_commands(code: str) -> tuple[list[str], list[str]]:
             1. Python packages from pip install commands (with versions if specified).
             2. npm packages from npm install commands (with versions if specified).
     '''
+    # the packages are deduplicated as they are found, keeping the first occurrence
     python_packages = []
     npm_packages = []
+    python_seen: Set[str] = set()
+    npm_seen: Set[str] = set()
 
     # Process the code line by line to handle both pip and npm commands
-    lines = code.split('\n')
-    for line in lines:
-        line = line.strip()
+    for line in code.splitlines():
+        # Skip lines without a command before stripping them, most lines have none
+        is_pip_command = PIP_INSTALL_COMMAND_PATTERN.search(line) is not None
+        if not is_pip_command and not NPM_INSTALL_COMMAND_PATTERN.search(line):
+            continue
 
-        # Skip empty lines and comments
-        if not line or line.startswith('#'):
+        # Skip comments
+        line = line.strip()
+        if line[0] == '#':
             continue
 
         # Handle pip install commands
-        if any(x in line for x in ['pip install', 'pip3 install', 'python -m pip install']):
+        if is_pip_command:
             # Remove the command part and any flags
             parts = line.split('install', 1)[1].strip()
             # Handle flags at the start
-            while parts.startswith(('-', '--')):
-                parts = parts.split(None, 1)[1]
+            parts = parts[LEADING_FLAGS_PATTERN.match(parts).end():]
 
             # Split by whitespace, respecting quotes
-            current = ''
-            in_quotes = False
-            quote_char = None
-            packages = []
-
-            for char in parts:
-                if char in '"\'':
-                    if not in_quotes:
-                        in_quotes = True
-                        quote_char = char
-                    elif char == quote_char:
-                        in_quotes = False
-                        quote_char = None
-                elif char.isspace() and not in_quotes:
-                    if current:
-                        packages.append(current)
-                        current = ''
-                else:
-                    current += char
-            if current:
-                packages.append(current)
+            packages = _split_install_arguments(parts)
 
             # Add packages, stripping quotes and ignoring flags
             for pkg in packages:
                 pkg = pkg.strip('"\'')
-                if pkg and not pkg.startswith(('-', '--')) and not pkg == '-r':
+                if pkg and not pkg.startswith(('-', '--')) and not pkg == '-r' and pkg not in python_seen:
+                    python_seen.add(pkg)
                     python_packages.append(pkg)
 
         # Handle npm/yarn install commands
-        elif any(x in line for x in ['npm install', 'npm i', 'yarn add']):
+        else:
             # Remove the command part and any flags
             if 'yarn add' in line:
                 parts = line.split('add', 1)[1]
@@ -860,30 +1247,19 @@ def extract_installation_commands(code: str) -> tuple[list[str], list[str]]:
             parts = parts.strip()
 
             # Handle flags at the start
-            while parts.startswith(('-', '--')):
-                parts = parts.split(None, 1)[1] if ' ' in parts else ''
+            parts = parts[LEADING_FLAGS_PATTERN.match(parts).end():]
 
             # Process each package
             for pkg in parts.split():
                 if pkg.startswith(('-', '--')) or pkg in ('install', 'i', 'add'):
                     continue
 
-                if pkg.startswith('@'):
-                    # Handle scoped packages (e.g., @types/node@16.0.0)
-                    if '@' in pkg[1:]:  # Has version
-                        pkg_parts = pkg.rsplit('@', 1)
-                        base_pkg = pkg_parts[0]  # @scope/name
-                        version = pkg_parts[1]  # version
-                        npm_packages.append(f"{base_pkg}@{version}")
-                    else:
-                        npm_packages.append(pkg)
-                else:
+                # Packages are kept with their versions as written, including scoped packages
+                # (e.g., @types/node@16.0.0)
+                if pkg not in npm_seen:
+                    npm_seen.add(pkg)
                     npm_packages.append(pkg)
 
-    # Remove duplicates while preserving order
-    python_packages = list(dict.fromkeys(python_packages))
-    npm_packages = list(dict.fromkeys(npm_packages))
-
     # Filter out npm command words
     npm_packages = [p for p in npm_packages if p not in (
         'npm', 'install', 'i', 'add')]
@@ -891,6 +1267,19 @@ def extract_installation_commands(code: str) -> tuple[list[str], list[str]]:
     return python_packages, npm_packages
 
 
+DEPENDENCY_TYPES = frozenset({"python", "npm"})
+
+# pip version specifiers; '>' and '<' also cover '>=' and '<='
+PIP_VERSION_SPECIFIER_PATTERN = re.compile(r'==|~=|[<>]')
+
+
+def has_pip_version_specifier(version: str) -> bool:
+    """
+    Whether a pip version carries a specifier such as '==' or '>=', rather than being a bare version.
+    """
+    return PIP_VERSION_SPECIFIER_PATTERN.search(version) is not None
+
+
 def validate_dependencies(dependencies: list) -> tuple[bool, str]:
     """
     Validate dependency list format and values.
@@ -899,7 +1288,6 @@ def validate_dependencies(dependencies: list) -> tuple[bool, str]:
     if not dependencies:
         return True, ""
 
-    valid_types = ["python", "npm"]
     for dep in dependencies:
         # Skip validation for empty rows
         if len(dep) != 3:
@@ -911,16 +1299,17 @@ def validate_dependencies(dependencies: list) -> tuple[bool, str]:
         if not pkg_name.strip():
             continue
 
-        if dep_type.lower() not in valid_types:
+        dep_type_lower = dep_type.lower()
+        if dep_type_lower not in DEPENDENCY_TYPES:
             return False, f"Invalid dependency type: {dep_type}"
 
         # Validate version format if specified
         if version.strip():
-            if dep_type.lower() == "python":
+            if dep_type_lower == "python":
                 # Check for valid pip version specifiers
-                if not any(op in version for op in ['==', '>=', '<=', '~=', '>', '<']) and version.lower() != "latest":
+                if not has_pip_version_specifier(version) and version.lower() != "latest":
                     return False, f"Invalid Python version format for {pkg_name}: {version}"
-            elif dep_type.lower() == "npm":
+            elif dep_type_lower == "npm":
                 # Check for valid npm version format (starts with @ or valid semver-like)
                 if not (version.startswith('@') or version.lower() == "latest"):
                     return False, f"Invalid NPM version format for {pkg_name}: {version}"
@@ -928,9 +1317,12 @@ def validate_dependencies(dependencies: list) -> tuple[bool, str]:
     return True, ""
 
 
+JAVA_PUBLIC_CLASS_PATTERN = re.compile(r'public\s+class\s+(\w+)')
+
+
 def extract_java_class_name(java_code: str) -> str:
     '''
     Extract the class name from Java code.
     '''
-    match = re.search(r'public\s+class\s+(\w+)', java_code)
+    match = JAVA_PUBLIC_CLASS_PATTERN.search(java_code)
     return match.group(1) if match else "Main"
\ No newline at end of file
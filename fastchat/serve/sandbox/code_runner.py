@@ -4,6 +4,7 @@ Run generated code in a sandbox environment.
 Gradio will interact with this module.
 '''
 
+from functools import lru_cache
 from typing import Any, Generator, Literal, TypeAlias, TypedDict, Set
 import uuid
 import gradio as gr
@@ -13,7 +14,7 @@ from e2b_code_interpreter import Sandbox as CodeSandbox
 from gradio_sandboxcomponent import SandboxComponent
 
 from fastchat.serve.sandbox.sandbox_state import ChatbotSandboxState
-from fastchat.serve.sandbox.code_analyzer import SandboxEnvironment, extract_code_from_markdown, extract_installation_commands, extract_java_class_name, extract_js_imports, extract_python_imports, replace_placeholder_urls, validate_dependencies
+from fastchat.serve.sandbox.code_analyzer import SandboxEnvironment, extract_code_from_markdown, extract_installation_commands, extract_java_class_name, extract_js_imports, extract_python_imports, has_pip_version_specifier, replace_placeholder_urls, validate_dependencies
 from fastchat.serve.sandbox.prompts import (
     DEFAULT_C_CODE_RUN_SANDBOX_INSTRUCTION, DEFAULT_CPP_CODE_RUN_SANDBOX_INSTRUCTION, DEFAULT_GOLANG_CODE_RUN_SANDBOX_INSTRUCTION, DEFAULT_GRADIO_SANDBOX_INSTRUCTION, DEFAULT_HTML_SANDBOX_INSTRUCTION, DEFAULT_JAVA_CODE_RUN_SANDBOX_INSTRUCTION, DEFAULT_JAVASCRIPT_RUNNER_INSTRUCTION, DEFAULT_MERMAID_SANDBOX_INSTRUCTION, DEFAULT_PYGAME_SANDBOX_INSTRUCTION, DEFAULT_PYTHON_RUNNER_INSTRUCTION, DEFAULT_REACT_SANDBOX_INSTRUCTION, DEFAULT_RUST_CODE_RUN_SANDBOX_INSTRUCTION, DEFAULT_STREAMLIT_SANDBOX_INSTRUCTION, DEFAULT_VUE_SANDBOX_INSTRUCTION, GENERAL_SANDBOX_INSTRUCTION
 )
@@ -209,12 +210,15 @@ def update_sandbox_config(
     return state
 
 
+@lru_cache(maxsize=2)
 def update_visibility(visible):
-    return [gr.update(visible=visible)] *14
+    # only two possible results, built once each
+    return (gr.update(visible=visible),) * 14
 
 
+@lru_cache(maxsize=8)
 def update_visibility_for_single_model(visible: bool, component_cnt: int):
-    return [gr.update(visible=visible)] * component_cnt
+    return (gr.update(visible=visible),) * component_cnt
 
 
 def mermaid_to_html(mermaid_code: str, theme: str = 'default') -> str:
@@ -865,7 +869,7 @@ def on_edit_dependency(
         if dep_type.lower() == "python":
             # Handle Python package with version
             if version and version.lower() != "latest":
-                if not any(op in version for op in ["==", ">=", "<=", "~=", ">", "<"]):
+                if not has_pip_version_specifier(version):
                     python_deps.append(f"{pkg_name}=={version}")
                 else:
                     python_deps.append(f"{pkg_name}{version}")
@@ -881,6 +885,18 @@ def on_edit_dependency(
             else:
                 npm_deps.append(pkg_name)
 
+    # Skip re-running the sandbox if dependencies are unchanged and the last run succeeded,
+    # a failed run can be retried with the same dependencies
+    existing_python_deps, existing_npm_deps = sandbox_state["code_dependencies"]
+    last_run_succeeded = sandbox_state["sandbox_run_round"] > 0 and not sandbox_state["sandbox_error"]
+    if (
+        last_run_succeeded
+        and python_deps == list(existing_python_deps)
+        and npm_deps == list(existing_npm_deps)
+    ):
+        yield gr.skip(), gr.skip(), gr.skip(), gr.skip()
+        return
+
     # Update sandbox state with new dependencies
     sandbox_state["code_dependencies"] = (python_deps, npm_deps)
 
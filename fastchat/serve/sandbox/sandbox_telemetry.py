@@ -1,9 +1,11 @@
 '''
 Module for logging the sandbox interactions and state.
 '''
+import atexit
 from concurrent.futures import ThreadPoolExecutor
 import json
 import os
+import threading
 from typing import Any, List, Literal, Optional, TypedDict
 import datetime
 
@@ -180,6 +182,69 @@ def upsert_sandbox_log(filename: str, data: str) -> None:
         fout.write(data)
 
 
+SANDBOX_LOG_THROTTLE_SECONDS = 0.3
+'''
+Min seconds between two sandbox log writes to the same file; writes in between are coalesced
+'''
+SANDBOX_LOG_WRITE_LOCKS = 64
+'''
+Number of locks that serialize sandbox log writes, a file always maps to the same lock
+'''
+
+
+class SandboxLogThrottler:
+    '''
+    Throttles bursts of sandbox log writes, e.g. from sandbox UI change events.
+    The first write to a file starts a timer and later writes only replace the pending data,
+    so during a burst a file is written at most once per `delay`, with the latest data.
+    Unlike a debounce, the timer is not restarted by later writes.
+    '''
+
+    def __init__(self, delay: float = SANDBOX_LOG_THROTTLE_SECONDS):
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.pending: dict[str, str] = {}
+        self.timers: dict[str, threading.Timer] = {}
+        # held across a file write, so two writes to the same file never interleave
+        self.write_locks = [threading.Lock() for _ in range(SANDBOX_LOG_WRITE_LOCKS)]
+        atexit.register(self.flush_all)
+
+    def upsert(self, filename: str, data: str) -> None:
+        with self.lock:
+            self.pending[filename] = data
+            if filename in self.timers:
+                # a write is already scheduled, it will pick up the latest data
+                return
+            timer = threading.Timer(self.delay, self.flush, args=(filename,))
+            timer.daemon = True
+            self.timers[filename] = timer
+            timer.start()
+
+    def flush(self, filename: str) -> None:
+        with self.write_locks[hash(filename) % len(self.write_locks)]:
+            # taken under the write lock, so a write never overwrites newer data
+            with self.lock:
+                data = self.pending.pop(filename, None)
+                self.timers.pop(filename, None)
+            if data is not None:
+                upsert_sandbox_log(filename=filename, data=data)
+
+    def flush_all(self) -> None:
+        '''
+        Write all pending logs now, e.g. on exit.
+        '''
+        with self.lock:
+            timers = list(self.timers.values())
+            filenames = list(self.pending)
+        for timer in timers:
+            timer.cancel()
+        for filename in filenames:
+            self.flush(filename)
+
+
+sandbox_log_throttler = SandboxLogThrottler()
+
+
 def create_sandbox_log(sandbox_state: ChatbotSandboxState, user_interaction_records: list[Any] | None) -> SandboxLog:
     return {
         "sandbox_state": sandbox_state,
@@ -206,7 +271,7 @@ def log_sandbox_telemetry_gradio_fn(
         ensure_ascii=False
     )
     filename = get_sandbox_log_filename(sandbox_state)
-    upsert_sandbox_log(filename=filename, data=log_data)
+    sandbox_log_throttler.upsert(filename=filename, data=log_data)
 
     # # Upload to Azure Blob Storage
     # if AZURE_BLOB_STORAGE_CONNECTION_STRING:
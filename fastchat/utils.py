@@ -272,6 +272,24 @@ alert_js = """
 }
 """
 
+# fetches html2canvas on first use and sets window.html2canvasLoaded to a promise,
+# which is cleared if the fetch fails so the next share retries it
+load_html2canvas_js = """
+    window.html2canvasLoaded = window.html2canvasLoaded || (window.html2canvas
+        ? Promise.resolve()
+        : new Promise((resolve, reject) => {
+            const script = document.createElement('script');
+            script.src = 'https://cdnjs.cloudflare.com/ajax/libs/html2canvas/1.4.1/html2canvas.min.js';
+            script.onload = resolve;
+            script.onerror = (error) => {
+                window.html2canvasLoaded = null;
+                script.remove();
+                reject(error);
+            };
+            document.head.appendChild(script);
+        }));
+"""
+
 
 def iter_over_async(
     async_gen: AsyncGenerator, event_loop: AbstractEventLoop
@@ -0,0 +1,15 @@
+from fastchat.serve.chat_state import LocalLogWriter
+
+
+def test_log_writer_appends_synchronously_when_queue_is_full(tmp_path):
+    writer = LocalLogWriter(max_queue_size=1)
+    # stop the writer thread and fill the queue, so it is never drained
+    writer.close()
+    writer.logs.put_nowait((str(tmp_path / "other.log"), b"pending\n"))
+    log_path = tmp_path / "logs" / "conv.log"
+
+    writer.log(str(log_path), b"first\n")
+    writer.log(str(log_path), b"second\n")
+
+    assert log_path.read_bytes() == b"first\nsecond\n"
+    assert writer.overflow_count == 2
@@ -1,4 +1,5 @@
 from fastchat.serve.sandbox.code_runner import extract_code_from_markdown, SandboxEnvironment, extract_installation_commands, extract_js_imports, extract_python_imports
+from fastchat.serve.sandbox.code_analyzer import analyze_jsts, analyze_python, determine_python_environment, detect_js_ts_code_lang, determine_jsts_environment, extract_js_from_html_script_tags
 
 def test_vue_component_extraction():
     # Test markdown content with Vue component
@@ -1234,6 +1235,84 @@ def test_dependency_formatting_for_ui():
     assert ["npm", "@org/pkg", "@^1.0.0"] in deps5
     assert ["npm", "@scope/nested/pkg", "@2.0.0"] in deps5
 
+def test_extract_python_imports_nested_statements():
+    code = """
+import numpy
+try:
+    import ujson as json
+except ImportError:
+    import simplejson
+def load():
+    from pandas import DataFrame
+class Model:
+    import torch
+match backend:
+    case "jax":
+        import jax
+plugin = importlib.import_module('requests.adapters')
+"""
+    packages = extract_python_imports(code)
+    assert sorted(packages) == ['jax', 'numpy', 'pandas', 'requests', 'simplejson', 'torch', 'ujson']
+
+def test_extract_js_imports_after_non_ascii_text():
+    code = """// Grüße, 世界
+import _ from 'lodash/fp';
+const pkg = require(`@scope/pkg/sub`);
+"""
+    assert sorted(extract_js_imports(code)) == ['@scope/pkg', 'lodash']
+
+def test_analyze_jsts_matches_separate_detection():
+    codes = [
+        "import React from 'react';\nconst App = () => <div>Hello</div>;",
+        "import { ref } from 'vue';\nconst count: number = 1;",
+        "const template = `<div v-if=\"show\">{{ msg }}</div>`;",
+        "const lodash = require('lodash');\nconsole.log(lodash);",
+    ]
+    for code in codes:
+        imports, env, lang = analyze_jsts(code)
+        assert sorted(imports) == sorted(extract_js_imports(code))
+        assert env == determine_jsts_environment(code, extract_js_imports(code))
+        assert lang == detect_js_ts_code_lang(code)
+
+def test_extract_js_from_html_multiple_scripts():
+    code = """<!DOCTYPE html>
+<html>
+<body>
+<script src="https://unpkg.com/three@0.150.0/build/three.min.js"></script>
+<script type="module">
+import confetti from 'canvas-confetti'
+import * as d3 from "https://cdn.jsdelivr.net/npm/d3@7/+esm";
+</script>
+<script>
+const _ = require('lodash')
+</script>
+<script type="module">
+import { createApp } from 'https://unpkg.com/vue@3/dist/vue.esm-browser.js'
+</script>
+</body>
+</html>
+"""
+    assert sorted(extract_js_from_html_script_tags(code)) == ['d3', 'lodash', 'three']
+
+def test_analyze_python_matches_separate_detection():
+    codes = [
+        "import streamlit as st\nimport pandas as pd\nst.write(pd.DataFrame())",
+        "import gradio as gr\ndemo = gr.Interface(fn=lambda x: x, inputs='text', outputs='text')",
+        "import pygame\nimport importlib\nnp = importlib.import_module('numpy')",
+        "print('hello')",
+    ]
+    for code in codes:
+        imports, env = analyze_python(code)
+        assert sorted(imports) == sorted(extract_python_imports(code))
+        assert env == determine_python_environment(code, extract_python_imports(code))
+    assert analyze_python("print('hello')", ('pygame',))[1] == SandboxEnvironment.PYGAME
+
+def test_extract_installation_commands_flags_only():
+    code = """pip install -q
+pip install --upgrade -q numpy
+npm install --save-dev	jest"""
+    assert extract_installation_commands(code) == (['numpy'], ['jest'])
+
 if __name__ == "__main__":
     test_vue_component_extraction()
     test_vue_component_typescript_detection()
@@ -1246,4 +1325,10 @@ if __name__ == "__main__":
     test_extract_code_from_markdown()
     test_dependency_handling()
     test_dependency_formatting_for_ui()
+    test_extract_python_imports_nested_statements()
+    test_extract_js_imports_after_non_ascii_text()
+    test_analyze_jsts_matches_separate_detection()
+    test_extract_js_from_html_multiple_scripts()
+    test_analyze_python_matches_separate_detection()
+    test_extract_installation_commands_flags_only()
     print("All tests passed successfully!")
\ No newline at end of file
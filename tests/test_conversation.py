@@ -0,0 +1,22 @@
+import random
+
+from fastchat.conversation import conv_templates
+
+
+def test_get_prompt_tail_matches_get_prompt():
+    rng = random.Random(0)
+    for name, template in conv_templates.items():
+        # API-only templates have no prompt format
+        if template.sep_style is None:
+            continue
+        for num_messages in range(10):
+            conv = template.copy()
+            conv.messages = []
+            for i in range(num_messages):
+                if i == num_messages - 1 and i % 2 == 1 and rng.random() < 0.5:
+                    message = None
+                else:
+                    message = "".join(rng.choice("ab \n") for _ in range(rng.randint(0, 40)))
+                conv.append_message(conv.roles[i % 2], message)
+            for n_chars in (1, 5, 20, 50, 100, 2000):
+                assert conv.get_prompt_tail(n_chars) == conv.get_prompt()[-n_chars:], (name, num_messages, n_chars)
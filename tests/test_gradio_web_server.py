@@ -0,0 +1,48 @@
+import asyncio
+
+from fastchat.constants import CONVERSATION_LIMIT_MSG, CONVERSATION_TURN_LIMIT
+from fastchat.serve import gradio_web_server
+from fastchat.serve.chat_state import ModelChatState
+from fastchat.serve.gradio_web_server import disable_btn, no_change_btn, submit_text
+from fastchat.serve.sandbox.code_runner import create_chatbot_sandbox_state
+
+
+def run_submit_text(state, text):
+    sandbox_state = create_chatbot_sandbox_state(btn_list_length=5)
+
+    async def collect():
+        return [
+            ret async for ret in submit_text(
+                state, "gpt-4o-2024-11-20", sandbox_state, text, "", 0.7, 1.0, 1024, None
+            )
+        ]
+
+    return asyncio.run(collect())
+
+
+def button_updates(ret):
+    # state and chatbot come first, then the buttons
+    return ret[2:7]
+
+
+def test_submit_text_empty_text_leaves_buttons_unchanged():
+    rets = run_submit_text(None, "")
+    assert rets
+    for ret in rets:
+        assert button_updates(ret) == (no_change_btn,) * 5
+        assert disable_btn not in button_updates(ret)
+
+
+def test_submit_text_turn_limit_leaves_buttons_unchanged(monkeypatch):
+    monkeypatch.setattr(gradio_web_server, "moderation_filter", lambda *args, **kwargs: False)
+    state = ModelChatState("gpt-4o-2024-11-20", chat_mode="direct", is_vision=False)
+    for _ in range(CONVERSATION_TURN_LIMIT):
+        state.conv.append_message(state.conv.roles[0], "hi")
+        state.conv.append_message(state.conv.roles[1], "hello")
+
+    rets = run_submit_text(state, "one more")
+    assert rets
+    # the textbox shows the limit message, and Clear stays usable
+    assert rets[0][7] == CONVERSATION_LIMIT_MSG
+    for ret in rets:
+        assert button_updates(ret) == (no_change_btn,) * 5
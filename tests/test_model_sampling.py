@@ -0,0 +1,68 @@
+import random
+
+from fastchat.serve import model_sampling
+from fastchat.serve.model_sampling import build_alias_table, build_cum_weights, sample_alias, sample_cum_weights
+
+
+def test_alias_table_matches_weights():
+    weights = {"a": 1, "b": 2, "c": 0, "d": 3.5, "e": 0.1}
+    table = build_alias_table(weights)
+    # the probability of each model is the mass of its own bucket plus the buckets aliased to it
+    n = len(table.keys)
+    mass = dict.fromkeys(table.keys, 0.0)
+    for i, model in enumerate(table.keys):
+        mass[model] += table.prob[i] / n
+        mass[table.keys[table.alias[i]]] += (1 - table.prob[i]) / n
+    total = sum(weights.values())
+    for model, weight in weights.items():
+        assert abs(mass[model] - weight / total) < 1e-9
+
+
+def test_alias_table_never_samples_zero_weight():
+    table = build_alias_table({"a": 0, "b": 1, "c": 0})
+    rng = random.Random(0)
+    assert {sample_alias(table, rng) for _ in range(1000)} == {"b"}
+
+
+def test_cum_weights_never_samples_zero_weight():
+    keys, cum_weights = build_cum_weights({"a": 0, "b": 1, "c": 0, "d": 3})
+    rng = random.Random(0)
+    assert {sample_cum_weights(keys, cum_weights, rng) for _ in range(1000)} == {"b", "d"}
+
+
+def test_sampler_follows_outage_models(monkeypatch):
+    table = model_sampling.get_sampler()
+    assert model_sampling.get_sampler() is table
+    outage = next(iter(model_sampling.SAMPLING_WEIGHTS))
+    monkeypatch.setattr(model_sampling, "OUTAGE_MODELS", frozenset([outage]))
+    assert outage not in model_sampling.get_sampler().keys
+
+
+def test_is_uniform():
+    assert model_sampling.is_uniform({"a": 1, "b": 1})
+    assert not model_sampling.is_uniform({"a": 1, "b": 2})
+    assert not model_sampling.is_uniform({"a": 0, "b": 0})
+    assert not model_sampling.is_uniform({})
+
+
+def test_set_outage_rebuilds_active_table(monkeypatch):
+    monkeypatch.setattr(model_sampling, "OUTAGE_MODELS", model_sampling.OUTAGE_MODELS)
+    monkeypatch.setattr(model_sampling, "_ACTIVE_ALIAS", {})
+    outage = next(iter(model_sampling.SAMPLING_WEIGHTS))
+    model_sampling.set_outage([outage])
+    rng = random.Random(0)
+    assert outage not in {model_sampling.sample_active(rng) for _ in range(1000)}
+
+
+def test_all_models_in_outage_draws_nothing(monkeypatch):
+    monkeypatch.setattr(model_sampling, "OUTAGE_MODELS", model_sampling.OUTAGE_MODELS)
+    monkeypatch.setattr(model_sampling, "_ACTIVE_ALIAS", {})
+    model_sampling.set_outage(model_sampling.SAMPLING_WEIGHTS)
+    assert model_sampling.get_sampler() is None
+    assert model_sampling.sample_active() is None
+
+
+def test_sampling_weights_sorted_by_decreasing_weight():
+    weights = list(model_sampling.SAMPLING_WEIGHTS.values())
+    assert weights == sorted(weights, reverse=True)
+